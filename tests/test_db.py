@@ -6,6 +6,7 @@ for a lock). All connections go through open_connection() and must set a
 consistent busy_timeout, so cron jobs fail after DB_TIMEOUT instead of
 hanging on lock contention.
 """
+import datetime
 import sqlite3
 import time
 
@@ -117,21 +118,63 @@ def test_init_db_creates_entries_index(tmp_path):
         "SELECT name FROM sqlite_master WHERE type='index'")}
     conn.close()
     assert "IDX_ENTRIES_MATCH" in idx
+    assert "IDX_EVENTS_DATETIME" in idx
 
 
-def test_get_entries_for_event_is_chronological(tmp_path):
+def test_refresh_stats_tracks_table_growth(tmp_path):
+    # stats gathered on a nearly empty table are replaced, not kept forever
+    conn = db.init_db(str(tmp_path / "t.db"))
+    conn.execute("INSERT INTO ENTRIES (MATCH, SOLD, AVAILABLE) VALUES ('m', 1, 1)")
+    conn.commit()
+    assert db.refresh_stats(conn) is True
+    stat = "SELECT stat FROM sqlite_stat1 WHERE idx = 'IDX_ENTRIES_MATCH'"
+    assert conn.execute(stat).fetchone() == ("1 1 1",)
+
+    conn.executemany(
+        "INSERT INTO ENTRIES (MATCH, SOLD, AVAILABLE) VALUES (?, 1, 1)",
+        [(f"m{i % 20}",) for i in range(5000)])
+    conn.commit()
+    assert db.refresh_stats(conn) is True
+    rows = int(conn.execute(stat).fetchone()[0].split()[0])
+    conn.close()
+    assert rows > 1
+
+
+def test_get_entries_for_events_is_chronological_per_event(tmp_path):
     # callers take [-1] as "latest"; ordering must not depend on physical row
     conn = db.init_db(str(tmp_path / "t.db"))
-    for sold, ts in [(1, "2020-01-01 00:00:00"),
-                     (2, "2021-01-01 00:00:00"),
-                     (3, "2022-01-01 00:00:00")]:
+    for match, sold, ts in [("m", 1, "2020-01-01 00:00:00"),
+                            ("n", 9, "2020-06-01 00:00:00"),
+                            ("m", 3, "2022-01-01 00:00:00"),
+                            ("m", 2, "2021-01-01 00:00:00"),
+                            ("x", 7, "2021-01-01 00:00:00")]:  # not asked for
         conn.execute(
             "INSERT INTO ENTRIES (MATCH, SOLD, AVAILABLE, TIMESTAMP) "
-            "VALUES ('m', ?, 1, ?)", (sold, ts))
+            "VALUES (?, ?, 1, ?)", (match, sold, ts))
     conn.commit()
-    rows = db.get_entries_for_event(conn, "m")
+    rows = db.get_entries_for_events(conn, ["m", "n", "none"])
+    assert db.get_entries_for_events(conn, []) == {}
     conn.close()
-    assert [r[1] for r in rows] == [1, 2, 3]
+    assert sorted(rows) == ["m", "n"]
+    assert [r[0] for r in rows["m"]] == [1, 2, 3]
+    assert rows["m"][0] == (1, 1, 1577836800)  # TIMESTAMP as UTC epoch seconds
+
+
+def test_get_events_since_filters_by_day(tmp_path):
+    conn = db.init_db(str(tmp_path / "t.db"))
+    conn.executemany(
+        "INSERT INTO EVENTS (ID, TITLE, DATETIME, SELLFROM, SELLTO) "
+        "VALUES (?, 't', ?, '', '')",
+        [("later", "2025-09-01T18:00:00+02:00"),
+         ("old", "2025-06-29T23:00:00+02:00"),
+         ("boundary", "2025-06-30 00:30:00"),
+         ("sooner", "2025-08-01T18:00:00+02:00")])
+    conn.commit()
+    since = db.get_events(conn, since=datetime.date(2025, 6, 30))
+    everything = db.get_events(conn)
+    conn.close()
+    assert [r[0] for r in since] == ["boundary", "sooner", "later"]
+    assert len(everything) == 4
 
 
 # --- retention: prune_old_entries ---
@@ -227,3 +270,154 @@ def test_update_event_keeps_metadata_when_unchanged(tmp_path):
     conn.close()
     assert title == "GAK 1902 : X"
     assert n_entries == 2
+
+
+# --- batched writes: update_events ---
+
+def _event(event_id, title="GAK 1902 : X"):
+    return {"id": event_id, "title": title,
+            "dateTimeFrom": "2099-01-01T20:00:00",
+            "publiclyAvailableFrom": "2099-01-01T00:00:00",
+            "publiclyAvailableTo": "2099-01-01T20:00:00"}
+
+
+def test_update_events_writes_all_rows(tmp_path):
+    conn = db.init_db(str(tmp_path / "t.db"))
+    rows = [(_event("a"), {"id": "a", "sold": 1, "avail": 9}),
+            (_event("b"), {"id": "b", "sold": 2, "avail": 8})]
+    assert db.update_events(conn, rows) == 2
+    entries = conn.execute(
+        "SELECT match, sold FROM entries ORDER BY match").fetchall()
+    conn.close()
+    assert entries == [("a", 1), ("b", 2)]
+
+
+def test_update_events_bad_row_only_loses_itself(tmp_path):
+    """A row the batch rejects falls back to per-event writes, so the other
+    events are still recorded (matching the old one-event-at-a-time loop)."""
+    conn = db.init_db(str(tmp_path / "t.db"))
+    broken = _event("b")
+    del broken["publiclyAvailableTo"]
+    rows = [(_event("a"), {"id": "a", "sold": 1, "avail": 9}),
+            (broken, {"id": "b", "sold": 2, "avail": 8})]
+    assert db.update_events(conn, rows) == 1
+    ids = [r[0] for r in conn.execute("SELECT id FROM events")]
+    conn.close()
+    assert ids == ["a"]
+
+
+def test_update_events_takes_write_lock_up_front(tmp_path):
+    """With another writer holding the lock, the batch fails at BEGIN
+    IMMEDIATE (after the busy timeout) and writes nothing."""
+    path = str(tmp_path / "t.db")
+    conn = db.init_db(path)
+    conn.execute("PRAGMA busy_timeout = 50")
+    other = db.open_connection(path)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        rows = [(_event("a"), {"id": "a", "sold": 1, "avail": 9})]
+        assert db.update_events(conn, rows) == 0
+        assert not conn.in_transaction
+    finally:
+        other.rollback()
+        other.close()
+    assert db.update_events(conn, rows) == 1
+    conn.close()
+
+
+def test_init_db_enables_wal(tmp_path):
+    conn = db.init_db(str(tmp_path / "t.db"))
+    mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    conn.close()
+    assert mode == "wal"
+
+
+def test_init_db_sets_page_size_on_new_db_only(tmp_path):
+    path = str(tmp_path / "t.db")
+    conn = db.init_db(path)
+    assert conn.execute("PRAGMA page_size").fetchone()[0] == db.PAGE_SIZE
+    conn.close()
+
+    legacy = str(tmp_path / "legacy.db")
+    raw = sqlite3.connect(legacy)
+    raw.execute("PRAGMA page_size = 4096")
+    raw.execute("CREATE TABLE T (X)")
+    raw.close()
+    conn = db.init_db(legacy)
+    assert conn.execute("PRAGMA page_size").fetchone()[0] == 4096
+    conn.close()
+
+
+def test_open_connection_applies_read_tuning(tmp_path):
+    path = str(tmp_path / "t.db")
+    db.init_db(path).close()
+    conn = db.open_connection(path, read_only=True)
+    cache = conn.execute("PRAGMA cache_size").fetchone()[0]
+    temp_store = conn.execute("PRAGMA temp_store").fetchone()[0]
+    conn.close()
+    assert cache == -db.CACHE_SIZE_KIB
+    assert temp_store == 2  # MEMORY
+
+
+# --- get_graph_series selection ---
+
+def test_get_graph_series_selection(tmp_path):
+    """Top-selling event + most recent past event + all future events,
+    ordered by kickoff, each with its own series; older past events and
+    events without entries are left out."""
+    conn = db.init_db(str(tmp_path / "t.db"))
+    for eid, when in [("old", "2000-01-01T20:00:00"),
+                      ("best", "2001-01-01T20:00:00"),
+                      ("recent", "2002-01-01T20:00:00"),
+                      ("next", "2099-01-01T20:00:00"),
+                      ("later", "2099-02-01T20:00:00")]:
+        conn.execute(
+            "INSERT INTO EVENTS (ID, TITLE, DATETIME, SELLFROM, SELLTO) "
+            "VALUES (?, ?, ?, ?, ?)", (eid, eid.title(), when, when, when))
+    for eid, sold in [("old", 10), ("best", 500), ("recent", 20), ("next", 5),
+                      ("next", 7)]:
+        conn.execute(
+            "INSERT INTO ENTRIES (MATCH, SOLD, AVAILABLE) VALUES (?, ?, 0)",
+            (eid, sold))
+    conn.commit()
+    rows = db.get_graph_series(conn)
+    conn.close()
+    assert [r[:2] for r in rows] == [("best", "Best"), ("recent", "Recent"),
+                                     ("next", "Next")]
+    assert rows[0][2] == "2001-01-01T20:00:00"
+    assert [sold for sold, _ in rows[2][3]] == [5, 7]
+
+
+def test_get_entries_for_events_returns_utc_epochs(tmp_path):
+    conn = db.init_db(str(tmp_path / "t.db"))
+    for sold, ts in [(1, "2099-01-01 10:00:00"),          # naive -> UTC
+                     (2, "2099-01-01T12:30:00+02:00"),    # == 10:30 UTC
+                     (3, "not a timestamp")]:             # skipped
+        conn.execute(
+            "INSERT INTO ENTRIES (MATCH, SOLD, AVAILABLE, TIMESTAMP) "
+            "VALUES ('m', ?, 1, ?)", (sold, ts))
+    conn.commit()
+    rows = db.get_entries_for_events(conn, ["m"])["m"]
+    conn.close()
+    assert rows == [(1, 1, 4070944800), (2, 1, 4070946600)]
+
+
+def test_http_cache_round_trip_and_drops_unseen(tmp_path):
+    conn = db.init_db(str(tmp_path / "t.db"))
+    assert db.load_http_cache(conn) == {}
+    assert db.save_http_cache(conn, {"a": ("e1", None, b"[1]"),
+                                     "b": (None, "lm", b"[2]")}, {"a", "b"})
+    # next run: "a" revalidated (kept as is), "b" no longer requested, "c" new
+    assert db.save_http_cache(conn, {"c": ("e3", None, b"[3]")}, {"a", "c"})
+    cache = db.load_http_cache(conn)
+    conn.close()
+    assert cache == {"a": ("e1", None, b"[1]"), "c": ("e3", None, b"[3]")}
+
+
+def test_parse_timestamp_normalises_to_utc_naive():
+    expected = datetime.datetime(2099, 1, 1, 10, 0, 0)
+    assert db.parse_timestamp("2099-01-01 10:00:00") == expected        # CURRENT_TIMESTAMP
+    assert db.parse_timestamp("2099-01-01T12:00:00+02:00") == expected  # offset -> UTC
+    assert db.parse_timestamp("Jan 1 2099 10:00") == expected           # dateutil fallback
+    with pytest.raises(ValueError):
+        db.parse_timestamp("not a timestamp")
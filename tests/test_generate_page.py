@@ -1,12 +1,17 @@
 """Tests for connection handling in ticket-fetch.py page generation.
 
-generate_page must read through a single shared read-only connection, and
-generate_mini_graph must use the caller's connection rather than opening one
-per past-event card (N cards used to mean N connections).
+generate_page must read through a single shared read-only connection and
+load the entries for all of its cards at once; generate_mini_graph draws from
+the rows it is handed rather than querying per past-event card (N cards used
+to mean N connections, then N queries).
 """
 import datetime
 from pathlib import Path
 
+import pytest
+
+from lib import graph
+
 
 def _seed_future_event(mod, db_path, event_id="evt1", title="GAK 1902 : Rival"):
     """Create a DB with one future event and one sales entry."""
@@ -24,32 +29,71 @@ def _seed_future_event(mod, db_path, event_id="evt1", title="GAK 1902 : Rival"):
     conn.close()
 
 
-def test_generate_mini_graph_uses_passed_connection(ticket_fetch, tmp_path, monkeypatch):
-    """generate_mini_graph queries the caller's connection; it must not open one."""
-    db_path = tmp_path / "m.db"
-    _seed_future_event(ticket_fetch, db_path)
-    conn = ticket_fetch.db.open_connection(str(db_path), read_only=True)
+def _entries(mod, db_path, event_id="evt1"):
+    conn = mod.db.open_connection(str(db_path), read_only=True)
     try:
-        def boom(*a, **k):
-            raise AssertionError("generate_mini_graph opened its own connection")
-        monkeypatch.setattr(ticket_fetch.db, "init_db", boom)
-        monkeypatch.setattr(ticket_fetch.db, "open_connection", boom)
-
-        event_time = datetime.datetime(2099, 1, 1, 20, 0, 0)
-        img = ticket_fetch.generate_mini_graph("evt1", event_time, conn)
-        assert img is not None  # produced a graph via the passed connection
+        return mod.db.get_entries_for_events(conn, [event_id])[event_id]
     finally:
         conn.close()
 
 
+def test_generate_mini_graph_draws_from_given_entries(ticket_fetch, tmp_path, monkeypatch):
+    """generate_mini_graph renders the rows it is given; it must not query."""
+    db_path = tmp_path / "m.db"
+    _seed_future_event(ticket_fetch, db_path)
+    entries = _entries(ticket_fetch, db_path)
+
+    def boom(*a, **k):
+        raise AssertionError("generate_mini_graph touched the database")
+    monkeypatch.setattr(ticket_fetch.db, "init_db", boom)
+    monkeypatch.setattr(ticket_fetch.db, "open_connection", boom)
+    monkeypatch.setattr(ticket_fetch.db, "get_entries_for_events", boom)
+
+    event_time = datetime.datetime(2099, 1, 1, 20, 0, 0)
+    assert ticket_fetch.generate_mini_graph("evt1", event_time, entries) is not None
+    assert ticket_fetch.generate_mini_graph("evt1", event_time, []) is None
+
+
+def test_generate_mini_graph_is_inline_svg(ticket_fetch):
+    """Mini graphs are plain SVG markup, and a flat series is drawn mid-height
+    instead of dividing by a zero range."""
+    kickoff = datetime.datetime(2099, 1, 1, 20, 0, 0)
+    epoch = kickoff.replace(tzinfo=datetime.timezone.utc).timestamp()
+    svg = ticket_fetch.generate_mini_graph(
+        "flat", kickoff, [(7, 0, epoch - 300 * 3600), (7, 0, epoch)])
+    assert svg.startswith('<svg class="mini-graph"') and svg.endswith('</svg>')
+    assert 'points="0.0,60.0 240.0,60.0"' in svg
+
+
+def test_generate_mini_graph_windows_on_utc_epochs(ticket_fetch, tmp_path):
+    """Samples are placed by UTC epoch: an offset timestamp is converted, an
+    unparseable one is skipped, and only the last 300 hours are plotted."""
+    db_path = tmp_path / "m.db"
+    _seed_future_event(ticket_fetch, db_path)
+    conn = ticket_fetch.db.init_db(str(db_path))
+    conn.executemany(
+        "INSERT INTO ENTRIES (MATCH,SOLD,AVAILABLE,TIMESTAMP) VALUES (?,?,?,?)",
+        [("evt1", 120, 50, "2099-01-01T14:00:00+02:00"),  # 12:00 UTC, 8 h out
+         ("evt1", 5, 50, "2098-11-01T10:00:00"),          # too old for the window
+         ("evt1", 999, 50, "not a timestamp")])
+    conn.commit()
+    conn.close()
+
+    svg = ticket_fetch.generate_mini_graph(
+        "evt1", datetime.datetime(2099, 1, 1, 20, 0, 0),
+        _entries(ticket_fetch, db_path))
+
+    # 10 h and 8 h before kickoff, at 100 and 120 sold (y grows downwards)
+    assert 'points="232.0,114.5 233.6,5.5"' in svg
+
+
 def test_generate_page_uses_single_readonly_connection(ticket_fetch, tmp_path, monkeypatch):
     """generate_page reads via exactly one read-only connection (no read-write)."""
     db_path = tmp_path / "p.db"
     _seed_future_event(ticket_fetch, db_path)
 
-    # Stub graph.generate_graph so the only real connection is generate_page's own.
-    monkeypatch.setattr(ticket_fetch.graph, "generate_graph", lambda path: "STUB")
-
+    # The main graph renders through generate_page's connection as well, so
+    # it is deliberately left unstubbed here.
     calls = {"init_db": 0, "open_ro": 0}
     real_init = ticket_fetch.db.init_db
     real_open = ticket_fetch.db.open_connection
@@ -111,7 +155,7 @@ def test_generate_page_default_templates_works_from_any_cwd(ticket_fetch, tmp_pa
     """
     db_path = tmp_path / "cwd.db"
     _seed_future_event(ticket_fetch, db_path)
-    monkeypatch.setattr(ticket_fetch.graph, "generate_graph", lambda path: "STUB")
+    monkeypatch.setattr(graph, "generate_graph", lambda conn: "STUB")
     # Run from an unrelated directory that contains no 'templates/'.
     other = tmp_path / "elsewhere"
     other.mkdir()
@@ -128,6 +172,48 @@ def test_generate_page_default_templates_works_from_any_cwd(ticket_fetch, tmp_pa
     assert "main-graph" in html, "the real template did not render"
 
 
+def test_template_env_is_built_once_with_bytecode_cache(ticket_fetch, tmp_path, monkeypatch):
+    """Repeated renders reuse one Jinja environment backed by a bytecode cache."""
+    db_path = tmp_path / "t.db"
+    _seed_future_event(ticket_fetch, db_path)
+    monkeypatch.setattr(graph, "generate_graph", lambda conn: "STUB")
+    ticket_fetch._template_env.cache_clear()
+
+    for name in ("a.html", "b.html"):
+        assert ticket_fetch.generate_page(db_path, tmp_path / name) is True
+
+    info = ticket_fetch._template_env.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
+    env = ticket_fetch._template_env(str(Path(ticket_fetch.__file__).parent / "templates"))
+    assert env.bytecode_cache is not None
+    assert env.auto_reload is False
+
+
+def test_generate_page_replaces_output_atomically(ticket_fetch, tmp_path, monkeypatch):
+    """The page is staged beside the target and renamed over it, success or
+    fallback, so the web server never serves a partial file."""
+    db_path = tmp_path / "t.db"
+    _seed_future_event(ticket_fetch, db_path)
+    out = tmp_path / "index.html"
+    out.write_text("OLD PAGE", encoding="utf-8")
+    replaced = []
+    real_replace = ticket_fetch.os.replace
+
+    def spy_replace(src, dst):
+        replaced.append((Path(src).name, Path(dst).name))
+        real_replace(src, dst)
+    monkeypatch.setattr(ticket_fetch.os, "replace", spy_replace)
+
+    monkeypatch.setattr(graph, "generate_graph", lambda conn: "STUB")
+    assert ticket_fetch.generate_page(db_path, out) is True
+    monkeypatch.setattr(graph, "generate_graph", lambda conn: None)
+    assert ticket_fetch.generate_page(db_path, out) is False
+
+    assert replaced == [("index.html.tmp", "index.html")] * 2
+    assert "ticket watch - ERROR" in out.read_text(encoding="utf-8")
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == ".tmp"] == []
+
+
 def test_velocity_window_normalises_offset_timestamps(ticket_fetch, tmp_path, monkeypatch):
     """Velocity windows compare against a UTC-naive `now`, so offset timestamps
     must be converted to UTC before the naive strip -- not stripped in place.
@@ -162,7 +248,7 @@ def test_velocity_window_normalises_offset_timestamps(ticket_fetch, tmp_path, mo
     ])
     out = tmp_path / "index.html"
     templates = Path(ticket_fetch.__file__).parent / "templates"
-    monkeypatch.setattr(ticket_fetch.graph, "generate_graph", lambda path: "STUB")
+    monkeypatch.setattr(graph, "generate_graph", lambda conn: "STUB")
     result = ticket_fetch.generate_page(db_path, out, str(templates))
     assert result is True
     html = out.read_text(encoding="utf-8")
@@ -172,3 +258,69 @@ def test_velocity_window_normalises_offset_timestamps(ticket_fetch, tmp_path, mo
     # we assert specifically on the 10-min term.)
     assert "in last 10min" not in html, \
         f"spurious 10-min velocity from mis-compared offset timestamps: {html}"
+
+
+def test_fetch_only_import_skips_drawing_modules():
+    """Loading the script must not import matplotlib, numpy or jinja2; only
+    page generation needs them."""
+    import subprocess
+    import sys
+    script = Path(__file__).resolve().parent.parent / "tickets" / "ticket-fetch.py"
+    code = (
+        "import importlib.util, sys\n"
+        f"spec = importlib.util.spec_from_file_location('tf', {str(script)!r})\n"
+        "tf = importlib.util.module_from_spec(spec)\n"
+        "spec.loader.exec_module(tf)\n"
+        "print(sorted(m for m in ('matplotlib', 'numpy', 'jinja2', 'lib.graph')"
+        " if m in sys.modules))\n"
+        "import datetime\n"
+        "assert tf.generate_mini_graph('e', datetime.datetime(2099, 1, 1),"
+        " [(1, 0, 4070908800.0)])\n"
+        "print('matplotlib' in sys.modules)\n")
+    out = subprocess.run([sys.executable, "-c", code], cwd=script.parent,
+                         capture_output=True, text=True, check=True).stdout
+    # nothing heavy on load; a mini graph needs numpy but not matplotlib
+    assert out.split() == ["[]", "False"]
+
+
+def test_generate_page_parses_each_kickoff_once(ticket_fetch, tmp_path, monkeypatch):
+    """Future and past sections share one parsed event list; an unparseable
+    kickoff is skipped rather than failing the page."""
+    db_path = tmp_path / "p.db"
+    _seed_future_event(ticket_fetch, db_path)
+    past = (datetime.datetime.now(datetime.timezone.utc)
+            - datetime.timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S")
+    conn = ticket_fetch.db.init_db(str(db_path))
+    for eid, when in [("Pastopponent", past), ("bad", "not a date")]:
+        conn.execute(
+            "INSERT INTO EVENTS (ID,TITLE,DATETIME,SELLFROM,SELLTO) "
+            "VALUES (?,?,?,?,?)", (eid, "GAK 1902 : " + eid, when, when, when))
+        conn.execute("INSERT INTO ENTRIES (MATCH,SOLD,AVAILABLE) VALUES (?,?,?)",
+                     (eid, 42, 1))
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(graph, "generate_graph", lambda conn: "STUB")
+
+    parsed = []
+    real_parse = ticket_fetch.db.parse_timestamp
+
+    def spy_parse(value):
+        parsed.append(value)
+        return real_parse(value)
+    monkeypatch.setattr(ticket_fetch.db, "parse_timestamp", spy_parse)
+
+    out = tmp_path / "index.html"
+    assert ticket_fetch.generate_page(db_path, out) is True
+    assert sorted(parsed) == sorted(["2099-01-01T20:00:00", past, "not a date"])
+    assert "Pastopponent" in out.read_text(encoding="utf-8")
+
+
+def test_sold_in_windows_spread_per_window(ticket_fetch):
+    now = 1_000_000.0
+    entries = [(100, 0, now - 2 * 86400),  # outside every window
+               (110, 0, now - 3000),       # in the hour, not the 10 min
+               (150, 0, now - 300),
+               (140, 0, now - 60)]         # counts can dip (refunds)
+    assert ticket_fetch._sold_in_windows(entries, now, (1440, 60, 10, 1)) == [40, 40, 10, 0]
+    # the result doesn't depend on the order the rows arrive in
+    assert ticket_fetch._sold_in_windows(entries[::-1], now, (1440, 60, 10, 1)) == [40, 40, 10, 0]
@@ -1,48 +1,20 @@
-"""Tests for tickets/lib/graph.py connection handling.
+"""Tests for tickets/lib/graph.py connection and figure handling.
 
-generate_graph must close its read-only connection on *every* exit path,
-including the early ``return None`` branches (no data) and exceptions.
-Previously it only closed on the success path, leaking a connection.
+generate_graph reads through the caller's read-only connection (the report
+renders from a single connection) and must leave it open for the caller on
+*every* exit path, including the early ``return None`` branches (no data)
+and exceptions. It must not leak a matplotlib figure either.
 """
-import sqlite3
+import base64
 
+import matplotlib.axes
 import pytest
 
 from lib import db, graph
 
 
-def _track_open(monkeypatch, holder):
-    """Capture the connection generate_graph opens so we can inspect it after."""
-    real_open = db.open_connection
-
-    def spy(path, read_only=False):
-        conn = real_open(path, read_only=read_only)
-        holder["conn"] = conn
-        return conn
-
-    monkeypatch.setattr(db, "open_connection", spy)
-
-
-def _assert_closed(conn):
-    """A closed sqlite3 connection raises ProgrammingError when used."""
-    with pytest.raises(sqlite3.ProgrammingError):
-        conn.execute("SELECT 1")
-
-
-def test_generate_graph_closes_connection_on_empty(tmp_path, monkeypatch):
-    """Empty DB -> no events -> return None, but the connection is still closed."""
-    db.init_db(str(tmp_path / "g.db")).close()  # schema only, no rows
-
-    holder = {}
-    _track_open(monkeypatch, holder)
-
-    assert graph.generate_graph(str(tmp_path / "g.db")) is None
-    _assert_closed(holder["conn"])  # would still be usable if it leaked
-
-
-def test_generate_graph_closes_connection_on_exception(tmp_path, monkeypatch):
-    """If plotting raises after the connection opened, it is closed in finally."""
-    conn = db.init_db(str(tmp_path / "g.db"))
+def _seed_one_event(db_path):
+    conn = db.init_db(str(db_path))
     conn.execute(
         "INSERT INTO EVENTS (ID,TITLE,DATETIME,SELLFROM,SELLTO) "
         "VALUES (?,?,?,?,?)",
@@ -55,42 +27,114 @@ def test_generate_graph_closes_connection_on_exception(tmp_path, monkeypatch):
     conn.commit()
     conn.close()
 
-    holder = {}
-    _track_open(monkeypatch, holder)
-    # Force an error in the plotting stage, after the connection is opened.
+
+@pytest.fixture
+def boom(monkeypatch):
+    """Force an error in the plotting stage, after the queries ran."""
     def _boom(*a, **k):
         raise RuntimeError("boom")
-    monkeypatch.setattr(graph.matplotlib.pyplot, "plot", _boom)
+    monkeypatch.setattr(matplotlib.axes.Axes, "add_collection", _boom)
 
-    assert graph.generate_graph(str(tmp_path / "g.db")) is None
-    _assert_closed(holder["conn"])
 
+def test_generate_graph_does_not_open_its_own_connection(tmp_path, monkeypatch):
+    _seed_one_event(tmp_path / "g.db")
+    conn = db.open_connection(str(tmp_path / "g.db"), read_only=True)
 
-def test_generate_graph_closes_figure_on_exception(tmp_path, monkeypatch):
-    """A plotting error must not leak the matplotlib figure.
+    def no_open(*a, **k):
+        raise AssertionError("generate_graph opened its own connection")
+    monkeypatch.setattr(db, "open_connection", no_open)
+    try:
+        assert graph.generate_graph(conn) is not None
+    finally:
+        conn.close()
 
-    generate_graph creates the figure before plotting; previously the figure
-    was only closed on the success path, so an exception after figure creation
-    left it open for the rest of the cron run."""
+
+def test_generate_graph_leaves_connection_open_on_empty(tmp_path):
+    """Empty DB -> no events -> return None; the caller's connection is intact."""
+    db.init_db(str(tmp_path / "g.db")).close()  # schema only, no rows
+    conn = db.open_connection(str(tmp_path / "g.db"), read_only=True)
+    try:
+        assert graph.generate_graph(conn) is None
+        conn.execute("SELECT 1")  # still usable
+    finally:
+        conn.close()
+
+
+def test_generate_graph_leaves_connection_open_on_exception(tmp_path, boom):
+    _seed_one_event(tmp_path / "g.db")
+    conn = db.open_connection(str(tmp_path / "g.db"), read_only=True)
+    try:
+        assert graph.generate_graph(conn) is None
+        conn.execute("SELECT 1")  # still usable
+    finally:
+        conn.close()
+
+
+def test_generate_graph_closes_figure_on_exception(tmp_path, boom):
+    """A plotting error must not leak a matplotlib figure.
+
+    generate_graph creates the figure before plotting; previously the pyplot
+    figure was only closed on the success path, so an exception after figure
+    creation left it open for the rest of the cron run. It now renders on a
+    standalone Figure that pyplot never tracks."""
     import matplotlib.pyplot as plt
+    _seed_one_event(tmp_path / "g.db")
+    plt.close("all")  # baseline: no leftover figures from earlier tests
+
+    conn = db.open_connection(str(tmp_path / "g.db"), read_only=True)
+    try:
+        assert graph.generate_graph(conn) is None
+    finally:
+        conn.close()
+    assert plt.get_fignums() == [], f"leaked figures: {plt.get_fignums()}"
+
+
+def test_generate_graph_renders_naive_kickoff(tmp_path):
+    """A naive kickoff time is treated as UTC like the entry timestamps,
+    rather than failing to subtract from a tz-aware entry time."""
     conn = db.init_db(str(tmp_path / "g.db"))
     conn.execute(
         "INSERT INTO EVENTS (ID,TITLE,DATETIME,SELLFROM,SELLTO) "
         "VALUES (?,?,?,?,?)",
-        ("evt1", "GAK 1902 : X", "2099-01-01T20:00:00+00:00",
-         "2099-01-01T00:00:00+00:00", "2099-01-01T20:00:00+00:00"))
+        ("evt1", "GAK 1902 : X", "2099-01-01T20:00:00",
+         "2099-01-01T00:00:00", "2099-01-01T20:00:00"))
+    for sold, ts in [(100, "2099-01-01 10:00:00"), (150, "2099-01-01 12:00:00")]:
+        conn.execute(
+            "INSERT INTO ENTRIES (MATCH,SOLD,AVAILABLE,TIMESTAMP) "
+            "VALUES (?,?,?,?)", ("evt1", sold, 50, ts))
+    conn.commit()
+
+    img = graph.generate_graph(conn)
+    conn.close()
+    assert img and base64.b64decode(img).startswith(b"\x89PNG")
+
+
+def test_generate_graph_windows_before_downsampling(tmp_path, monkeypatch):
+    """Samples beyond GRAPH_HOURS are dropped before thinning, so they don't
+    use up the MAX_POINTS budget of the visible part of the line."""
+    conn = db.init_db(str(tmp_path / "g.db"))
     conn.execute(
+        "INSERT INTO EVENTS (ID,TITLE,DATETIME,SELLFROM,SELLTO) "
+        "VALUES (?,?,?,?,?)",
+        ("evt1", "GAK 1902 : X", "2099-03-01T00:00:00", "", ""))
+    # 3000 samples from 1100 h out (clipped by the axis), 1500 in the window
+    conn.executemany(
         "INSERT INTO ENTRIES (MATCH,SOLD,AVAILABLE,TIMESTAMP) "
-        "VALUES (?,?,?,?)",
-        ("evt1", 100, 50, "2099-01-01T10:00:00+00:00"))
+        "VALUES ('evt1', ?, 0, datetime('2099-03-01', ?))",
+        [(i, f"-{1100 * 60 - i * 10} minutes") for i in range(4500)])
     conn.commit()
-    conn.close()
 
-    plt.close("all")  # baseline: no leftover figures from earlier tests
+    drawn = []
+    real = graph.LineCollection
 
-    def _boom(*a, **k):
-        raise RuntimeError("boom")
-    monkeypatch.setattr(graph.matplotlib.pyplot, "plot", _boom)
+    def spy(segments, *a, **k):
+        drawn.extend(segments)
+        return real(segments, *a, **k)
+    monkeypatch.setattr(graph, "LineCollection", spy)
+    img = graph.generate_graph(conn)
+    conn.close()
 
-    assert graph.generate_graph(str(tmp_path / "g.db")) is None
-    assert plt.get_fignums() == [], f"leaked figures: {plt.get_fignums()}"
+    assert img is not None
+    (segment,) = drawn
+    assert segment[:, 0].max() <= graph.GRAPH_HOURS
+    assert len(segment) == 1500   # the whole window, not thinned
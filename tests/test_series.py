@@ -0,0 +1,15 @@
+"""Tests for tickets/lib/series.py."""
+import numpy as np
+
+from lib import series
+
+
+def test_downsample_caps_points_and_keeps_latest():
+    hours = np.arange(7000, 0, -1.0)
+    sold = np.arange(7000)
+    h, s = series.downsample(hours, sold, max_points=2000)
+    assert len(h) == len(s) <= 2000
+    assert (h[-1], s[-1]) == (1.0, 6999)       # still ends on the newest sample
+    assert np.all(np.diff(s) > 0)               # order preserved
+    short = np.arange(5)
+    assert series.downsample(short, short)[0] is short
@@ -5,6 +5,7 @@ The upstream ticket server has regular short downtimes while cron polls every
 These tests pin that behaviour and the api layer's raise-don't-log contract.
 """
 import datetime
+import json
 import logging
 import sys
 
@@ -182,6 +183,13 @@ class _FakeResponse:
             raise self._json_exc
         return self._json_data
 
+    @property
+    def content(self):
+        # raw body, as read by the optional orjson decoder
+        if self._json_exc is not None:
+            return b"<html>not json</html>"
+        return json.dumps(self._json_data).encode()
+
 
 def _patch_get(monkeypatch, response=None, exc=None):
     def fake_get(*args, **kwargs):
@@ -240,6 +248,129 @@ def test_fetch_event_details_502_raises(monkeypatch):
     assert "evt" in str(ei.value)
 
 
+def test_fetch_all_event_data_keeps_order_and_returns_errors(monkeypatch):
+    # results line up with the input events; a failing event yields its
+    # FetchError in place instead of aborting the whole batch
+    def fake_get(url, **kwargs):
+        if "/bad/" in url:
+            return _FakeResponse(status=502)
+        return _FakeResponse(json_data={"sectorRepresentationConfigurations": [
+            {"seatConfigurations": [{"seatStatus": "SOLD"}]}]})
+    monkeypatch.setattr(api.requests, "get", fake_get)
+
+    events = [{"id": "a", "title": "A"}, {"id": "bad"}, {"id": "c", "title": "C"}]
+    out = api.fetch_all_event_data("https://x/", events)
+    assert out[0] == {"title": "A", "id": "a", "sold": 1, "avail": 0}
+    assert isinstance(out[1], FetchError)
+    assert out[2] == {"title": "C", "id": "c", "sold": 1, "avail": 0}
+    assert api.fetch_all_event_data("https://x/", []) == []
+
+
+def test_fetch_events_uses_given_session(monkeypatch):
+    # with a session, requests go through it (pooled keep-alive connections)
+    def no_module_get(*a, **k):
+        raise AssertionError("bypassed the session")
+    monkeypatch.setattr(api.requests, "get", no_module_get)
+
+    class _Session:
+        def __init__(self):
+            self.urls = []
+
+        def get(self, url, **kwargs):
+            self.urls.append(url)
+            return _FakeResponse(json_data=[])
+
+    session = _Session()
+    assert api.fetch_events("https://x/", "ep", session=session) == []
+    api.fetch_event_details("https://x/", "evt", session=session)
+    assert session.urls == [
+        "https://x/ep", "https://x/evt/public-stadium-representation-config"]
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_fetch_event_details_decoders_agree(monkeypatch, use_orjson):
+    # orjson is optional; with or without it the same JSON comes back and
+    # a malformed body still surfaces as FetchError
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(api, "orjson", None)
+    _patch_get(monkeypatch, response=_FakeResponse(json_data={"a": [1, 2]}))
+    assert api.fetch_event_details("https://x/", "evt") == {"a": [1, 2]}
+    _patch_get(monkeypatch, response=_FakeResponse(json_exc=ValueError("bad")))
+    with pytest.raises(FetchError, match="Invalid JSON response"):
+        api.fetch_event_details("https://x/", "evt")
+
+
+def test_make_session_pools_and_retries():
+    with api.make_session() as session:
+        adapter = session.get_adapter("https://ticket.grazerak.at/")
+        assert adapter._pool_maxsize == api.MAX_WORKERS
+        assert adapter.max_retries.total == 3
+        assert 502 in adapter.max_retries.status_forcelist
+    with api.make_session(2) as session:
+        assert session.get_adapter("https://x/")._pool_maxsize == 2
+
+
+def test_response_cache_revalidates_and_reuses_body(monkeypatch):
+    # a stored ETag is sent back; a 304 returns the stored body and keeps the
+    # entry, a 200 with an ETag replaces it, one without is not cached
+    sent = []
+
+    def fake_get(url, headers=None, **kwargs):
+        sent.append(headers)
+        if url.endswith("/same/public-stadium-representation-config"):
+            return _FakeResponse(status=304)
+        response = _FakeResponse(json_data=[{"id": "new"}])
+        response.headers = {"ETag": '"v2"'} if url.endswith("ep") else {}
+        return response
+    monkeypatch.setattr(api.requests, "get", fake_get)
+
+    details = "https://x/same/public-stadium-representation-config"
+    cache = api.ResponseCache({
+        "https://x/ep": ('"v1"', None, b'[{"id": "old"}]'),
+        details: ('"d1"', "Mon, 01 Jan 2099 00:00:00 GMT", b'{"ok": true}')})
+
+    assert api.fetch_events("https://x/", "ep", cache=cache) == [{"id": "new"}]
+    assert api.fetch_event_details("https://x/", "same", cache=cache) == {"ok": True}
+    api.fetch_event_details("https://x/", "plain", cache=cache)
+
+    assert sent == [{"If-None-Match": '"v1"'},
+                    {"If-None-Match": '"d1"',
+                     "If-Modified-Since": "Mon, 01 Jan 2099 00:00:00 GMT"},
+                    {}]
+    assert cache.updated == {"https://x/ep": ('"v2"', None, json.dumps(
+        [{"id": "new"}]).encode())}
+    assert cache.seen == {"https://x/ep", details}
+
+
+def test_response_cache_keeps_parsed_counts_not_config_bodies(monkeypatch):
+    # details are cached as their parsed counts under a separate key; a 304
+    # reuses them with the title from the current listing
+    def fake_get(url, headers=None, **kwargs):
+        if headers:
+            return _FakeResponse(status=304)
+        response = _FakeResponse(json_data={"sectorRepresentationConfigurations": [
+            {"seatConfigurations": [{"seatStatus": "SOLD"}] * 3}]})
+        response.headers = {"ETag": '"e1"'}
+        return response
+    monkeypatch.setattr(api.requests, "get", fake_get)
+
+    key = "https://x/a/public-stadium-representation-config" + api.PARSED_SUFFIX
+    first = api.ResponseCache()
+    assert api.fetch_all_event_data("https://x/", [{"id": "a", "title": "Old"}],
+                                    cache=first) == [
+        {"title": "Old", "id": "a", "sold": 3, "avail": 0}]
+    etag, _, body = first.updated[key]
+    assert json.loads(body) == {"title": "Old", "id": "a", "sold": 3, "avail": 0}
+
+    second = api.ResponseCache(first.updated)
+    assert api.fetch_all_event_data("https://x/", [{"id": "a", "title": "New"}],
+                                    cache=second) == [
+        {"title": "New", "id": "a", "sold": 3, "avail": 0}]
+    assert second.updated == {} and second.seen == {key}
+
+
 def test_fetch_events_does_not_log_to_stdout_on_failure(monkeypatch, caplog):
     # the api layer must not alert on its own; main() owns alerting
     _patch_get(monkeypatch, response=_FakeResponse(status=502))
@@ -321,3 +452,34 @@ def test_main_successful_fetch_clears_failure_state(
                      lambda *a, **k: [])
     assert code == 0
     assert not state.exists()                       # outage state cleared
+
+
+def test_main_rejects_zero_workers(ticket_fetch, monkeypatch, tmp_path):
+    code = _run_main(ticket_fetch, monkeypatch, tmp_path,
+                     ["--db", str(tmp_path / "events.db"), "--workers", "0"],
+                     lambda *a, **k: [])
+    assert code == 2                                # argparse usage error
+
+
+# --------------------------------------------------------------------------
+# main(): events whose online sale has closed reuse their last sample
+# --------------------------------------------------------------------------
+
+def test_reuse_closed_sales_skips_fetch_only_with_a_sample(ticket_fetch, tmp_path):
+    conn = ticket_fetch.db.init_db(str(tmp_path / "events.db"))
+    conn.execute("INSERT INTO ENTRIES (MATCH, SOLD, AVAILABLE, TIMESTAMP) "
+                 "VALUES ('closed', 90, 10, '2000-01-01 10:00:00')")
+    conn.execute("INSERT INTO ENTRIES (MATCH, SOLD, AVAILABLE, TIMESTAMP) "
+                 "VALUES ('closed', 95, 5, '2000-01-01 11:00:00')")
+    conn.commit()
+    events = [
+        {"id": "closed", "title": "C", "publiclyAvailableTo": "2000-01-02T00:00:00Z"},
+        {"id": "unseen", "title": "U", "publiclyAvailableTo": "2000-01-02T00:00:00Z"},
+        {"id": "selling", "title": "S", "publiclyAvailableTo": "2099-01-01T00:00:00Z"},
+        {"id": "odd", "title": "O", "publiclyAvailableTo": "whenever"},
+        {"id": "epoch", "title": "E", "publiclyAvailableTo": 946771200000},
+    ]
+    rows, to_fetch = ticket_fetch._reuse_closed_sales(conn, events)
+    conn.close()
+    assert rows == [(events[0], {"title": "C", "id": "closed", "sold": 95, "avail": 5})]
+    assert [e["id"] for e in to_fetch] == ["unseen", "selling", "odd", "epoch"]
@@ -1,7 +1,16 @@
 """GAK Ticket parsing library."""
 
+import importlib
+
 from . import db
 from . import api
-from . import graph
 
 __all__ = ['db', 'api', 'graph']
+
+
+def __getattr__(name):
+    # graph pulls in matplotlib and numpy, which take a few hundred ms to
+    # import and are only needed to draw; load it on first access.
+    if name == 'graph':
+        return importlib.import_module('.graph', __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
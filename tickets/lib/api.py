@@ -1,10 +1,34 @@
 """API operations for GAK ticket tracking."""
 
-import requests
+import json
 import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib decoder
+    orjson = None
 
 REQUEST_TIMEOUT = 30
 
+# Upper bound on concurrent event-detail requests. The fetch is pure network
+# I/O against a single host, so a few threads cut the N x RTT loop down to
+# roughly one RTT per batch without hammering the upstream server.
+MAX_WORKERS = 8
+
+# Transient upstream errors worth retrying within a run before giving up and
+# letting the caller's alert-grace logic take over.
+RETRY_STATUSES = (502, 503, 504)
+
+# Appended to a URL to key a ResponseCache entry that holds a parsed result
+# rather than the response body.
+PARSED_SUFFIX = "#parsed"
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,17 +41,134 @@ class FetchError(Exception):
     """
 
 
-def fetch_events(base_url, events_ep, timeout=REQUEST_TIMEOUT):
+def _decode_json(response):
+    """Decode a response body as JSON, raising ValueError if it isn't.
+
+    Uses orjson when installed: the stadium config runs to thousands of seat
+    objects per event and orjson decodes it several times faster than the
+    stdlib json behind ``response.json()``. orjson.JSONDecodeError is a
+    ValueError, so callers handle both decoders the same way.
+    """
+    if orjson is None:
+        return response.json()
+    return orjson.loads(response.content)
+
+
+def _loads(body):
+    """Decode a stored JSON body (bytes), with orjson when installed."""
+    if orjson is None:
+        return json.loads(body)
+    return orjson.loads(body)
+
+
+def _dumps(data):
+    """Encode ``data`` as a JSON body (bytes), with orjson when installed."""
+    if orjson is None:
+        return json.dumps(data).encode()
+    return orjson.dumps(data)
+
+
+class ResponseCache:
+    """Remembered responses for conditional GETs, keyed by URL.
+
+    ``entries`` maps a key to ``(etag, last_modified, body)`` from an earlier
+    run (see db.load_http_cache). A request for a known URL sends
+    If-None-Match / If-Modified-Since, and a 304 reuses the stored body, so an
+    unchanged resource costs a header-only round trip. ``updated`` collects
+    new 200 responses that carried a validator, and ``seen`` every key whose
+    entry is current after this run (updated or confirmed by a 304); the
+    caller stores them back with db.save_http_cache, dropping the rest.
+
+    Responses fetched with a ``parse`` function are remembered by their
+    parsed result rather than the raw body: for the multi-MB stadium configs
+    only the small counts are held until the run ends and written back.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.updated = {}
+        self.seen = set()
+
+    def get(self, http, url, timeout, parse=None):
+        """GET ``url`` through ``http`` and return the decoded JSON.
+
+        With ``parse``, return ``parse(decoded)`` instead; that result is what
+        gets cached, under ``url + PARSED_SUFFIX`` so it is never mistaken for
+        a raw body. A None result is not cached. Raises what the request,
+        raise_for_status or the decoder raise; the fetch_* callers turn those
+        into FetchError.
+        """
+        key = url if parse is None else url + PARSED_SUFFIX
+        entry = self.entries.get(key)
+        headers = {}
+        if entry is not None:
+            etag, last_modified, _ = entry
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        response = http.get(url, timeout=timeout, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            self.seen.add(key)
+            return _loads(entry[2])
+        response.raise_for_status()
+        data = _decode_json(response)
+        if parse is None:
+            body = response.content
+        else:
+            data = parse(data)
+            body = None if data is None else _dumps(data)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if body is not None and (etag or last_modified):
+            self.updated[key] = (etag, last_modified, body)
+            self.seen.add(key)
+        return data
+
+
+def _get_json(http, url, timeout, cache, parse=None):
+    """GET ``url`` and decode it (then ``parse`` it, if given), revalidating
+    through ``cache`` if given."""
+    if cache is not None:
+        return cache.get(http, url, timeout, parse)
+    response = http.get(url, timeout=timeout)
+    response.raise_for_status()
+    data = _decode_json(response)
+    return data if parse is None else parse(data)
+
+
+def make_session(max_workers=MAX_WORKERS):
+    """Return a requests.Session for the ticket API.
+
+    Every call goes to the same host, so a shared session keeps the TCP+TLS
+    connection alive across requests instead of handshaking per event. The
+    pool is sized for ``max_workers`` concurrent fetches, and connection errors
+    and gateway statuses are retried a few times with a short backoff.
+    The caller owns the session and should close it (it is a context manager).
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=max_workers,
+        max_retries=Retry(total=3, backoff_factor=0.3,
+                          status_forcelist=RETRY_STATUSES))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def fetch_events(base_url, events_ep, timeout=REQUEST_TIMEOUT, session=None,
+                 cache=None):
     """Fetch the list of future published events from the API.
 
     Returns the parsed list (possibly empty) on success. Raises FetchError
     on any network, HTTP, or parse failure, so a server problem can be told
-    apart from a genuinely empty result.
+    apart from a genuinely empty result. ``session`` (see make_session) is
+    used if given; otherwise a one-off connection is made. With a
+    ResponseCache, an unchanged list is revalidated instead of re-downloaded.
     """
+    http = session or requests
     try:
-        response = requests.get(base_url + events_ep, timeout=timeout)
-        response.raise_for_status()
-        data = response.json()
+        data = _get_json(http, base_url + events_ep, timeout, cache)
     except requests.exceptions.Timeout as e:
         raise FetchError("Timeout fetching events from API") from e
     except requests.exceptions.RequestException as e:
@@ -42,17 +183,19 @@ def fetch_events(base_url, events_ep, timeout=REQUEST_TIMEOUT):
     return data
 
 
-def fetch_event_details(base_url, event_id, timeout=REQUEST_TIMEOUT):
+def fetch_event_details(base_url, event_id, timeout=REQUEST_TIMEOUT, session=None,
+                        cache=None, parse=None):
     """Fetch event details (stadium representation config) from the API.
 
-    Returns the parsed JSON on success. Raises FetchError on any network,
-    HTTP, or parse failure.
+    Returns the parsed JSON on success, or ``parse(json)`` if ``parse`` is
+    given (with a cache, only that result is remembered). Raises FetchError
+    on any network, HTTP, or parse failure. ``session`` and ``cache`` are
+    used as in fetch_events.
     """
     chk_url = base_url + event_id + "/public-stadium-representation-config"
+    http = session or requests
     try:
-        response = requests.get(chk_url, timeout=timeout)
-        response.raise_for_status()
-        return response.json()
+        return _get_json(http, chk_url, timeout, cache, parse)
     except requests.exceptions.Timeout as e:
         raise FetchError(f"Timeout fetching details for event {event_id}") from e
     except requests.exceptions.RequestException as e:
@@ -61,6 +204,42 @@ def fetch_event_details(base_url, event_id, timeout=REQUEST_TIMEOUT):
         raise FetchError(f"Invalid JSON response for event {event_id}: {e}") from e
 
 
+def fetch_all_event_data(base_url, events, timeout=REQUEST_TIMEOUT,
+                         max_workers=MAX_WORKERS, session=None, cache=None):
+    """Fetch and parse details for several events concurrently.
+
+    Returns a list aligned with ``events``: each item is parse_event_data's
+    result (a dict, or None if the payload didn't parse), or the FetchError
+    raised for that event. Failures are returned rather than raised so one
+    bad event doesn't discard the others' results.
+
+    Each worker parses its own response straight away, so only the small
+    per-event counts outlive the request -- the multi-MB stadium configs are
+    never all held in memory at once. Pass a make_session() session so the
+    workers share pooled keep-alive connections, and a ResponseCache to
+    revalidate unchanged configs instead of downloading them again; the cache
+    keeps only each config's parsed counts, not the config itself.
+    """
+    def fetch(event):
+        try:
+            parsed = fetch_event_details(
+                base_url, event["id"], timeout, session, cache,
+                parse=lambda content: parse_event_data(event, content))
+        except FetchError as e:
+            return e
+        if parsed is not None:
+            # A revalidated result was parsed on an earlier run; name it
+            # after the current listing.
+            parsed.update(title=event.get("title", "Unknown"),
+                          id=event.get("id", ""))
+        return parsed
+
+    if not events:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(events))) as pool:
+        return list(pool.map(fetch, events))
+
+
 def parse_event_data(event, content):
     """Parse event data from API response with validation."""
     try:
@@ -76,8 +255,9 @@ def parse_event_data(event, content):
             logger.error(f"Event {event.get('id')}: sectorRepresentationConfigurations is not a list")
             return None
 
-        sold_cnt = 0
-        avail_cnt = 0
+        # Counter tallies each sector's seats in C; a stadium has thousands
+        # of seats, so this is the hot loop of every cron run.
+        statuses = Counter()
         for entry in content['sectorRepresentationConfigurations']:
             if not isinstance(entry, dict):
                 continue
@@ -87,17 +267,13 @@ def parse_event_data(event, content):
                 logger.warning(f"Event {event.get('id')}: invalid seatConfigurations, skipping")
                 continue
 
-            for e in seat_configs:
-                if e.get('seatStatus') == 'SOLD':
-                    sold_cnt += 1
-                elif e.get('seatStatus') == 'AVAILABLE':
-                    avail_cnt += 1
+            statuses.update(e.get('seatStatus') for e in seat_configs)
 
         return {
             "title": event.get("title", "Unknown"),
             "id": event.get("id", ""),
-            "sold": sold_cnt,
-            "avail": avail_cnt
+            "sold": statuses['SOLD'],
+            "avail": statuses['AVAILABLE']
         }
     except Exception as e:
         logger.error(f"Error parsing event data: {e}")
@@ -2,6 +2,11 @@
 
 import sqlite3
 import logging
+import datetime
+from itertools import groupby
+from operator import itemgetter
+
+import dateutil.parser
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +25,40 @@ DB_TIMEOUT = 30
 # margin for ad-hoc analysis without bloating every query.
 RETENTION_DAYS = 60
 
+# Per-connection read tuning, applied in open_connection so the report's
+# read-only connection gets it too. Reads go through a memory map instead of
+# read() syscalls, the page cache may hold up to 64 MiB (negative values are
+# KiB), and ORDER BY / GROUP BY temporaries stay in memory.
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 64 * 1024
+
+# Page size for newly created databases. It can only be chosen before the
+# first table exists (and before the switch to WAL); existing databases keep
+# the page size they were created with.
+PAGE_SIZE = 8192
+
+# Rows sampled per index when refresh_stats re-runs ANALYZE: approximate
+# stats are all the planner needs, at a fixed cost instead of a full scan.
+ANALYSIS_LIMIT = 400
+
+
+def parse_timestamp(value):
+    """Parse a stored ISO-8601 timestamp into a UTC-naive datetime.
+
+    ``datetime.fromisoformat`` (C-implemented) handles everything this tool
+    writes -- SQLite CURRENT_TIMESTAMP and the API's ISO strings -- so
+    dateutil is only the fallback for anything more exotic. Offset values are
+    converted to UTC before dropping the tzinfo. Raises ValueError (which
+    dateutil's ParserError subclasses) if the value can't be parsed.
+    """
+    try:
+        ts = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        ts = dateutil.parser.parse(value)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return ts
+
 
 def open_connection(db_path, read_only=False):
     """Open a SQLite connection with a consistent busy timeout.
@@ -36,6 +75,9 @@ def open_connection(db_path, read_only=False):
         else:
             conn = sqlite3.connect(str(db_path), timeout=DB_TIMEOUT)
         conn.execute(f'PRAGMA busy_timeout = {int(DB_TIMEOUT * 1000)}')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KIB}')
+        conn.execute('PRAGMA temp_store = MEMORY')
         return conn
     except sqlite3.Error as e:
         logger.error(f"Failed to open database {db_path}: {e}")
@@ -46,6 +88,14 @@ def init_db(db_file):
     """Initialize database schema."""
     try:
         conn = open_connection(db_file)
+        if not conn.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchone():
+            conn.execute(f'PRAGMA page_size = {PAGE_SIZE}')
+        # WAL lets the report's read-only connection read while a later cron
+        # run writes, and with synchronous=NORMAL a commit no longer fsyncs
+        # the database file (only checkpoints do). journal_mode is persistent;
+        # synchronous is per connection, so it is set on every writer here.
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
         conn.execute('''
             CREATE TABLE IF NOT EXISTS EVENTS
             (
@@ -65,88 +115,272 @@ def init_db(db_file):
                 TIMESTAMP   DATETIME    NOT NULL    DEFAULT CURRENT_TIMESTAMP
             );''')
 
-        # get_entries_for_event filters WHERE MATCH=? and renderers take the
-        # last row as "latest"; without this index every per-event lookup is a
+        # Validators and body of the last API response per URL, for the
+        # conditional GETs in api.ResponseCache.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS HTTP_CACHE
+            (
+                URL         TEXT        PRIMARY KEY NOT NULL,
+                ETAG        TEXT,
+                LAST_MOD    TEXT,
+                BODY        BLOB        NOT NULL
+            );''')
+
+        # Entry reads filter on MATCH and renderers take the last row by
+        # TIMESTAMP as "latest"; without this index every such lookup is a
         # full scan, which slows as the table grows (see prune_old_entries).
         conn.execute('''
             CREATE INDEX IF NOT EXISTS IDX_ENTRIES_MATCH
             ON ENTRIES(MATCH, TIMESTAMP)
             ''')
+
+        # get_graph_series picks the event with the top SOLD sample;
+        # with this index that is a single seek instead of a full sort.
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS IDX_ENTRIES_SOLD
+            ON ENTRIES(SOLD DESC)
+            ''')
+
+        # get_graph_series and the report select events by kickoff
+        # relative to now (datetime < / > DATE('now')); index it so those
+        # branches are range seeks rather than scans of EVENTS.
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS IDX_EVENTS_DATETIME
+            ON EVENTS(DATETIME)
+            ''')
         return conn
     except sqlite3.Error as e:
         logger.error(f"Failed to initialize database: {e}")
         raise
 
 
+_UPSERT_EVENT = '''
+    INSERT INTO EVENTS
+    (ID, TITLE, DATETIME, SELLFROM, SELLTO) VALUES
+    (:id, :title, :dateTimeFrom, :publiclyAvailableFrom,
+    :publiclyAvailableTo)
+    ON CONFLICT(ID) DO UPDATE SET
+      TITLE   = excluded.TITLE,
+      DATETIME = excluded.DATETIME,
+      SELLFROM = excluded.SELLFROM,
+      SELLTO   = excluded.SELLTO
+    '''
+
+_INSERT_ENTRY = '''
+    INSERT INTO ENTRIES (MATCH, SOLD, AVAILABLE) VALUES
+    (:id, :sold, :avail)'''
+
+
 def update_event(conn, event, entry):
     """Update database with event and entry data."""
     try:
-        conn.execute('''
-            INSERT INTO EVENTS
-            (ID, TITLE, DATETIME, SELLFROM, SELLTO) VALUES
-            (:id, :title, :dateTimeFrom, :publiclyAvailableFrom,
-            :publiclyAvailableTo)
-            ON CONFLICT(ID) DO UPDATE SET
-              TITLE   = excluded.TITLE,
-              DATETIME = excluded.DATETIME,
-              SELLFROM = excluded.SELLFROM,
-              SELLTO   = excluded.SELLTO
-            ''', event)
-
-        conn.execute('''
-            INSERT INTO ENTRIES (MATCH, SOLD, AVAILABLE) VALUES
-            (:id, :sold, :avail)''', entry)
+        conn.execute(_UPSERT_EVENT, event)
+        conn.execute(_INSERT_ENTRY, entry)
         return True
     except sqlite3.Error as e:
         logger.error(f"Failed to update database for event {event.get('id', 'unknown')}: {e}")
         return False
 
 
-def get_events(conn):
-    """Get all events from database."""
+def update_events(conn, rows):
+    """Upsert events and append their entries in a single transaction.
+
+    ``rows`` is a list of ``(event, entry)`` pairs as taken by update_event.
+    Both tables are written with one executemany each and committed once,
+    instead of two statements per event. If the batch is rejected by a bad
+    row (e.g. a missing field), it is rolled back and retried per event so
+    only the offending event is lost, as before. Returns the number of
+    events written.
+
+    The transaction is opened with BEGIN IMMEDIATE, so the write lock is
+    taken (or waited for, up to the busy timeout) before any statement runs,
+    rather than sqlite3's implicit deferred BEGIN upgrading to a writer
+    part-way through the batch.
+    """
+    if not rows:
+        return 0
+    try:
+        with conn:
+            if not conn.in_transaction:
+                conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(_UPSERT_EVENT, (event for event, _ in rows))
+            conn.executemany(_INSERT_ENTRY, (entry for _, entry in rows))
+        return len(rows)
+    except sqlite3.OperationalError as e:
+        # Locked/unwritable database: retrying row by row would only wait
+        # out the busy timeout once per event.
+        logger.error(f"Failed to update database: {e}")
+        return 0
+    except sqlite3.Error as e:
+        logger.warning(f"Batch update failed ({e}); retrying per event")
+
+    updated = sum(1 for event, entry in rows if update_event(conn, event, entry))
+    conn.commit()
+    return updated
+
+
+def get_events(conn, since=None):
+    """Get events from database as ``(ID, TITLE, DATETIME)`` rows.
+
+    With ``since`` (a date), only events kicking off on or after that day are
+    returned, oldest first. The filter compares DATETIME as text against the
+    ISO date, which IDX_EVENTS_DATETIME serves as a range scan instead of the
+    caller parsing every event ever stored. DATETIME keeps the API's UTC
+    offset, so the cut is only day-accurate: pass a day of slack and compare
+    the parsed kickoffs for anything finer.
+    """
     try:
-        cur = conn.execute("SELECT * FROM events")
+        if since is None:
+            cur = conn.execute("SELECT ID, TITLE, DATETIME FROM events")
+        else:
+            cur = conn.execute(
+                "SELECT ID, TITLE, DATETIME FROM events WHERE DATETIME >= ? "
+                "ORDER BY DATETIME", (since.isoformat(),))
         return cur.fetchall()
     except sqlite3.Error as e:
         logger.error(f"Failed to get events: {e}")
         return []
 
 
-def get_entries_for_event(conn, event_id):
-    """Get all entries for a specific event, oldest first.
+def get_entries_for_events(conn, event_ids):
+    """Get the entries of several events in one query, oldest first.
 
-    Ordered by TIMESTAMP so callers taking [-1] get the genuinely latest
-    sample regardless of physical row order; served by IDX_ENTRIES_MATCH.
+    Returns ``{event_id: [(SOLD, AVAILABLE, EPOCH), ...]}`` for the events
+    that have any. EPOCH is the TIMESTAMP as UTC epoch seconds, converted by
+    SQLite (naive values are UTC, as CURRENT_TIMESTAMP writes them), so
+    callers do time arithmetic on plain ints; rows whose TIMESTAMP doesn't
+    parse are skipped. One IN (...) query walks IDX_ENTRIES_MATCH in
+    (MATCH, TIMESTAMP) order, so the rows arrive grouped per event and each
+    list's [-1] is the genuinely latest sample, instead of a query per event.
     """
+    event_ids = list(event_ids)
+    if not event_ids:
+        return {}
     try:
-        cur = conn.execute(
-            "SELECT * FROM ENTRIES WHERE MATCH=? ORDER BY TIMESTAMP",
-            (event_id,))
-        return cur.fetchall()
+        cur = conn.execute(f'''
+            SELECT MATCH, SOLD, AVAILABLE,
+                   CAST(strftime('%s', TIMESTAMP) AS INTEGER) AS EPOCH
+            FROM ENTRIES
+            WHERE MATCH IN ({','.join('?' * len(event_ids))})
+              AND EPOCH IS NOT NULL
+            ORDER BY MATCH, TIMESTAMP
+            ''', event_ids)
+        return {match: [row[1:] for row in rows]
+                for match, rows in groupby(cur, key=itemgetter(0))}
     except sqlite3.Error as e:
-        logger.error(f"Failed to get entries for event {event_id}: {e}")
-        return []
+        logger.error(f"Failed to get entries for events: {e}")
+        return {}
+
+
+def get_latest_entry(conn, event_id):
+    """Get an event's newest ``(SOLD, AVAILABLE)`` sample, or None if it has
+    none (or on error). A single seek on IDX_ENTRIES_MATCH."""
+    try:
+        return conn.execute(
+            "SELECT SOLD, AVAILABLE FROM ENTRIES WHERE MATCH=? "
+            "ORDER BY TIMESTAMP DESC LIMIT 1", (event_id,)).fetchone()
+    except sqlite3.Error as e:
+        logger.error(f"Failed to get latest entry for event {event_id}: {e}")
+        return None
 
 
-def get_events_for_graph(conn):
-    """Get events needed for graph generation."""
+def get_graph_series(conn):
+    """Get the graphed events and their sales series in one query.
+
+    The events are the one holding the all-time top SOLD sample, the most
+    recent past event, and every future event (each selector computed once
+    in a CTE and served by IDX_ENTRIES_SOLD / IDX_EVENTS_DATETIME). They are
+    joined to their entries through IDX_ENTRIES_MATCH, so the whole graph is
+    read in a single statement instead of one query per event.
+
+    Returns ``[(id, title, datetime, [(sold, epoch), ...]), ...]`` ordered
+    by kickoff, each series oldest first with TIMESTAMP as UTC epoch seconds
+    as in get_entries_for_events. Events without entries are left out.
+    """
     try:
         cur = conn.execute('''
-            SELECT * FROM (SELECT * FROM events WHERE id IN
-            (SELECT match FROM entries ORDER BY sold DESC LIMIT 1))
-            UNION SELECT * FROM
-            (SELECT * FROM events WHERE datetime < DATE('now')
-             ORDER BY datetime DESC LIMIT 1)
-            UNION SELECT * FROM
-            (SELECT * FROM events WHERE datetime > DATE('now'))
-            ORDER BY datetime
+            WITH top AS (
+                SELECT match FROM entries ORDER BY sold DESC LIMIT 1
+            ), last_past AS (
+                SELECT id FROM events WHERE datetime < DATE('now')
+                ORDER BY datetime DESC LIMIT 1
+            ), selected AS (
+                SELECT id, title, datetime FROM events
+                WHERE id IN (SELECT match FROM top)
+                   OR id IN (SELECT id FROM last_past)
+                   OR datetime > DATE('now')
+            )
+            SELECT s.id, s.title, s.datetime, en.sold,
+                   CAST(strftime('%s', en.timestamp) AS INTEGER) AS epoch
+            FROM selected s JOIN entries en ON en.match = s.id
+            WHERE epoch IS NOT NULL
+            ORDER BY s.datetime, s.id, en.timestamp
             ''')
-        return cur.fetchall()
+        return [(*event, [row[3:] for row in rows])
+                for event, rows in groupby(cur, key=itemgetter(0, 1, 2))]
     except sqlite3.Error as e:
-        logger.error(f"Failed to get events for graph: {e}")
+        logger.error(f"Failed to get graph series: {e}")
         return []
 
 
+def load_http_cache(conn):
+    """Return the stored responses as ``{url: (etag, last_mod, body)}``.
+
+    Returns an empty dict on error: without the cache every request is simply
+    a full download, as before.
+    """
+    try:
+        return {url: (etag, last_mod, body) for url, etag, last_mod, body
+                in conn.execute("SELECT URL, ETAG, LAST_MOD, BODY FROM HTTP_CACHE")}
+    except sqlite3.Error as e:
+        logger.error(f"Failed to load HTTP cache: {e}")
+        return {}
+
+
+def save_http_cache(conn, updated, keep):
+    """Store new responses and drop entries for URLs not in ``keep``.
+
+    ``updated`` maps URL to ``(etag, last_mod, body)``; unchanged (304) entries
+    are only kept, not rewritten, so their bodies cost no write. URLs that
+    were not requested this run (e.g. a finished event) are removed. Returns
+    True on success; a failure is logged and the next run refetches in full.
+    """
+    try:
+        with conn:
+            keep = list(keep)
+            conn.execute(
+                f"DELETE FROM HTTP_CACHE WHERE URL NOT IN ({','.join('?' * len(keep))})",
+                keep)
+            conn.executemany(
+                "INSERT OR REPLACE INTO HTTP_CACHE (URL, ETAG, LAST_MOD, BODY) "
+                "VALUES (?, ?, ?, ?)",
+                [(url, *entry) for url, entry in updated.items()])
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"Failed to save HTTP cache: {e}")
+        return False
+
+
+def refresh_stats(conn):
+    """Re-gather the planner statistics in sqlite_stat1.
+
+    Without current stats the planner guesses index selectivity from
+    whatever was measured last -- possibly a nearly empty table. Run after
+    each fetch's writes: with analysis_limit each index is sampled rather
+    than scanned, so this stays well under a millisecond however large
+    ENTRIES grows. Returns True on success; a failure is logged and the old
+    stats stay in place.
+    """
+    try:
+        conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+        conn.execute('ANALYZE')
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        logger.warning(f"Failed to refresh planner statistics: {e}")
+        return False
+
+
 def prune_old_entries(conn, days=RETENTION_DAYS):
     """Delete ENTRIES rows older than ``days`` to bound table growth.
 
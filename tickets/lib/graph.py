@@ -4,26 +4,36 @@ import io
 import logging
 import sqlite3
 import datetime
-import base64
+import binascii
 import traceback
-import dateutil.parser
 import numpy as np
 
 import matplotlib
-matplotlib.use('Agg')  # Non-interactive backend for cron
-import matplotlib.pyplot  # used as matplotlib.pyplot.* throughout; no alias
+import matplotlib.style
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+
+from .series import downsample
 
 logger = logging.getLogger(__name__)
 
+# Hours before kickoff shown on the main graph's x axis.
+GRAPH_HOURS = 600
+
+
+def generate_graph(conn):
+    """Generate sales graph with error handling. Returns base64-encoded PNG.
 
-def generate_graph(db_path):
-    """Generate sales graph with error handling. Returns base64-encoded PNG."""
-    conn = None
+    Reads through the caller-supplied (read-only) connection, like
+    generate_mini_graph, so the report renders from one connection instead
+    of reopening the database; the caller owns and closes it.
+    """
     try:
         # Import here to avoid a circular import.
-        from .db import open_connection, get_events_for_graph
-        conn = open_connection(db_path, read_only=True)
-        events = get_events_for_graph(conn)
+        from .db import get_graph_series, parse_timestamp
+        events = get_graph_series(conn)
 
         if not events:
             logger.warning("No events found to graph")
@@ -34,11 +44,10 @@ def generate_graph(db_path):
             event = {}
             event['id'] = entry[0]
             event['title'] = entry[1]
+            event['series'] = entry[3]
             try:
-                event['time'] = dateutil.parser.parse(entry[2])
-                event['sellfrom'] = dateutil.parser.parse(entry[3])
-                event['sellto'] = dateutil.parser.parse(entry[4])
-            except (dateutil.parser.ParserError, ValueError) as e:
+                event['time'] = parse_timestamp(entry[2])
+            except ValueError as e:
                 logger.error(f"Error parsing date for event {entry[0]}: {e}")
                 continue
             parsed_events.append(event)
@@ -47,68 +56,78 @@ def generate_graph(db_path):
             logger.warning("No valid events to graph")
             return None
 
-        # Create graph
-        matplotlib.pyplot.style.use('tableau-colorblind10')
-        matplotlib.pyplot.figure(figsize=(10, 6))
-        matplotlib.pyplot.title("Ticket Sales Over Time")
-        matplotlib.pyplot.xlabel("Hours Until Match")
-        matplotlib.pyplot.ylabel("Tickets Sold (Online Available)")
-        matplotlib.pyplot.grid(True, linestyle='--', alpha=0.7)
-
-        # Collect final sales numbers for average calculation
-        final_sales = []
-
-        for event in parsed_events:
-            try:
-                cur = conn.execute("SELECT * FROM ENTRIES WHERE MATCH=?", (event['id'],))
-                entries = cur.fetchall()
-
-                hours = []
-                sold = []
-                for entry in entries:
-                    tickets = {}
-                    tickets['sold'] = entry[1]
-                    try:
-                        tickets['time'] = dateutil.parser.parse(entry[3])
-                        tickets['time'] = tickets['time'].replace(tzinfo=datetime.timezone.utc)
-                        h_diff = (event['time']-tickets['time']).total_seconds() / 3600
-                        tickets['diff'] = h_diff
-
-                        hours.append(h_diff)
-                        sold.append(tickets['sold'])
-
-                    except (dateutil.parser.ParserError, ValueError, KeyError) as e:
-                        logger.warning(f"Error parsing entry for event {event['id']}: {e}")
-                        continue
-
-                if hours and sold:
-                    matplotlib.pyplot.plot(hours, sold, label=event['title'])
-                    # Collect final sales number (last entry)
-                    final_sales.append(sold[-1])
-
-            except sqlite3.Error as e:
-                logger.error(f"Database error while fetching entries for {event['id']}: {e}")
-                continue
-
-        # Calculate and plot average line (horizontal)
-        if final_sales:
-            avg_sales = np.mean(final_sales)
-            matplotlib.pyplot.axhline(y=avg_sales, color='black', linestyle='--',
-                                     linewidth=1, label=f'Average ({int(avg_sales)})', alpha=0.4)
-
-        if not matplotlib.pyplot.gca().has_data():
-            logger.warning("No data to plot")
-            return None
-
-        matplotlib.pyplot.gca().set_xlim([0, 600])
-        matplotlib.pyplot.gca().invert_xaxis()
-        matplotlib.pyplot.gca().xaxis.get_major_locator().set_params(integer=True)
-        matplotlib.pyplot.legend(loc='upper left', bbox_to_anchor=(1, 1), fontsize='small')
-        matplotlib.pyplot.tight_layout()
-
-        tmpfile = io.BytesIO()
-        matplotlib.pyplot.savefig(tmpfile, format='png')
-        img = base64.b64encode(tmpfile.getvalue()).decode('utf-8')
+        # Render through the object-oriented API on an explicit Agg canvas:
+        # no pyplot figure manager or global current-figure state, and the
+        # style only applies inside this block instead of process-wide.
+        with matplotlib.style.context('tableau-colorblind10'):
+            fig = Figure(figsize=(10, 6))
+            FigureCanvasAgg(fig)
+            ax = fig.subplots()
+            ax.set_title("Ticket Sales Over Time")
+            ax.set_xlabel("Hours Until Match")
+            ax.set_ylabel("Tickets Sold (Online Available)")
+            ax.grid(True, linestyle='--', alpha=0.7)
+
+            # Collect final sales numbers for average calculation
+            final_sales = []
+            segments = []
+            titles = []
+
+            for event in parsed_events:
+                # Entry timestamps arrive as UTC epoch seconds (converted by
+                # SQLite), so the hours-until-kickoff axis is one array op
+                # instead of a dateutil parse + datetime subtraction per row.
+                # parse_timestamp gives the kickoff as UTC-naive.
+                event_epoch = event['time'].replace(
+                    tzinfo=datetime.timezone.utc).timestamp()
+
+                sold, stamps = (np.asarray(col) for col in zip(*event['series']))
+                hours = (event_epoch - stamps) / 3600
+                # Window before thinning, so samples the axis would clip
+                # don't use up the MAX_POINTS budget of the visible part.
+                recent = hours <= GRAPH_HOURS
+                segments.append(np.column_stack(
+                    downsample(hours[recent], sold[recent])))
+                titles.append(event['title'])
+                # Collect final sales number (last entry)
+                final_sales.append(sold[-1])
+
+            # All event lines go into one LineCollection (a single artist and
+            # draw call) instead of one Line2D per event. Colours follow the
+            # style's cycle, as separate plot() calls would; the legend gets
+            # proxy handles since a collection carries only one label.
+            handles = []
+            if segments:
+                cycle = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+                colors = [cycle[i % len(cycle)] for i in range(len(segments))]
+                ax.add_collection(LineCollection(segments, colors=colors))
+                ax.autoscale_view()
+                handles = [Line2D([], [], color=color, label=title)
+                           for color, title in zip(colors, titles)]
+
+            # Calculate and plot average line (horizontal)
+            if final_sales:
+                avg_sales = np.mean(final_sales)
+                handles.append(ax.axhline(
+                    y=avg_sales, color='black', linestyle='--', linewidth=1,
+                    label=f'Average ({int(avg_sales)})', alpha=0.4))
+
+            if not ax.has_data():
+                logger.warning("No data to plot")
+                return None
+
+            ax.set_xlim([0, GRAPH_HOURS])
+            ax.invert_xaxis()
+            ax.xaxis.get_major_locator().set_params(integer=True)
+            ax.legend(handles=handles, loc='upper left', bbox_to_anchor=(1, 1), fontsize='small')
+            fig.tight_layout()
+
+            tmpfile = io.BytesIO()
+            fig.savefig(tmpfile, format='png')
+        # Encode straight from the buffer's memoryview rather than copying the
+        # PNG out with getvalue() first; this is the C routine behind
+        # base64.b64encode.
+        img = binascii.b2a_base64(tmpfile.getbuffer(), newline=False).decode('ascii')
 
         return img
 
@@ -119,11 +138,3 @@ def generate_graph(db_path):
         logger.error(f"Error generating graph: {e}")
         logger.debug(traceback.format_exc())
         return None
-    finally:
-        # Close on every path (incl. the early `return None` branches and
-        # exceptions); previously the connection only closed on success.
-        # Also release the matplotlib figure, which used to leak on every
-        # non-success path (early returns + exceptions).
-        matplotlib.pyplot.close('all')
-        if conn is not None:
-            conn.close()
@@ -0,0 +1,26 @@
+"""Sales-series helpers shared by the graphs.
+
+NumPy only: the page's SVG mini graphs use these without importing
+matplotlib.
+"""
+
+import numpy as np
+
+# Most samples drawn per line. One sample per 5-minute cron run adds ~7000
+# points over the 600-hour window, far more than a graph has pixels;
+# beyond this the extra points only cost drawing time.
+MAX_POINTS = 2000
+
+
+def downsample(hours, sold, max_points=MAX_POINTS):
+    """Thin a series to at most ``max_points`` samples by striding.
+
+    The stride is counted back from the newest sample, so the line still
+    ends on the latest value. Shorter series are returned unchanged.
+    """
+    n = len(hours)
+    if n <= max_points:
+        return hours, sold
+    step = -(-n // max_points)  # ceil(n / max_points)
+    keep = np.arange(n - 1, -1, -step)[::-1]
+    return hours[keep], sold[keep]
@@ -5,27 +5,23 @@ Runs via cron every 5 minutes.
 
 import argparse
 import html
-import io
 import logging
 import os
 import sys
 import traceback
-import base64
 import datetime
-import dateutil.parser
+import functools
+from dataclasses import dataclass
 from pathlib import Path
 
 # gak_common lives at the repo root (one level up from this script).
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from gak_common.log import resolve_log_level
 
-import jinja2
-
-from lib import db, api, graph
-
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+# Only db and api are needed to fetch; jinja2, numpy, matplotlib and
+# lib.graph are imported inside the page/graph functions, so a run without
+# --generate (or one that exits early) doesn't pay their import time.
+from lib import db, api
 
 
 # Setup logging
@@ -52,350 +48,413 @@ EST_DEDUCT = 2864           # deducted in the "w/o est. season tickets" line
 STADIUM_CAPACITY = 15000    # denominator for the %-of-capacity bar
 
 
-def generate_error_html(error_message, last_successful_run=None):
-    """Generate HTML error page.
-
-    Both inputs are HTML-escaped: ``error_message`` is frequently upstream
-    or exception text (e.g. a FetchError echoing a server response) and the
-    page is served publicly, so unescaped interpolation would be an
-    injection vector.
-    """
-    error_message = html.escape(str(error_message))
-    last_run_html = (
-        f"    <p><em>Last successful run: {html.escape(str(last_successful_run))}</em></p>"
-        if last_successful_run else "")
-    return f'''<!DOCTYPE html>
+# --- Page cards ------------------------------------------------------------
+# One object per card passed to the template. Slotted dataclasses rather than
+# dicts: a fixed layout per card, and the template's ``event.title`` and
+# ``event["title"]`` lookups both resolve to the attribute.
+@dataclass(slots=True)
+class EventCard:
+    """An upcoming event with its latest sales sample."""
+    title: str
+    id: str
+    sold: int
+    avail: int
+    capacity_percent: int = 0
+    velocity: str = ''
+
+
+@dataclass(slots=True)
+class PastEventCard:
+    """A past event of the current season, ranked by tickets sold."""
+    title: str
+    date: str
+    sold: int
+    graph: str | None
+    event_id: str
+    rank: int = 0
+    top_performer: bool = False
+
+
+# Static error/empty pages, filled in with %-formatting: a single pass over
+# the string, so substituted text is never re-scanned for placeholders, and
+# the CSS braces need no doubling.
+_ERROR_HTML = '''<!DOCTYPE html>
 <html>
 <head>
 <meta http-equiv="refresh" content="300">
 <title>GAK ticket watch - ERROR</title>
 <style>
-    body {{
+    body {
         font-family: Arial, sans-serif;
         background-color: #f4f4f4;
         color: #333;
         margin: 0;
         padding: 20px;
-    }}
-    .error {{
+    }
+    .error {
         background-color: #fee;
         border: 1px solid #cc0000;
         border-radius: 5px;
         padding: 15px;
         margin: 20px 0;
-    }}
-    h1 {{ color: #cc0000; }}
+    }
+    h1 { color: #cc0000; }
 </style>
 </head>
 <body>
     <div class="error">
         <h1>⚠️ Error</h1>
-        <p><strong>{error_message}</strong></p>
+        <p><strong>%(message)s</strong></p>
         <p>Next automatic run in 5 minutes.</p>
     </div>
-{last_run_html}
+%(last_run)s
 </body>
 </html>'''
 
-
-def generate_empty_html(message="No upcoming events found"):
-    """Generate HTML page for empty state.
-
-    ``message`` is HTML-escaped for the same reason as the error page: it is
-    rendered on a public page and could originate from upstream text.
-    """
-    message = html.escape(str(message))
-    return f'''<!DOCTYPE html>
+_EMPTY_HTML = '''<!DOCTYPE html>
 <html>
 <head>
 <meta http-equiv="refresh" content="300">
 <title>GAK ticket watch</title>
 <style>
-    body {{
+    body {
         font-family: Arial, sans-serif;
         background-color: #f4f4f4;
         color: #333;
         margin: 0;
         padding: 20px;
-    }}
-    .info {{
+    }
+    .info {
         background-color: #e8f4ff;
         border: 1px solid #b3d9ff;
         border-radius: 5px;
         padding: 15px;
         margin: 20px 0;
-    }}
+    }
 </style>
 </head>
 <body>
     <div class="info">
         <h1>GAK Ticket Watch</h1>
-        <p>{message}</p>
+        <p>%(message)s</p>
     </div>
 </body>
 </html>'''
 
 
-def generate_mini_graph(event_id, event_time, conn):
-    """Generate mini graph for a single event. Returns base64-encoded PNG or None.
+def generate_error_html(error_message, last_successful_run=None):
+    """Generate HTML error page.
+
+    Both inputs are HTML-escaped: ``error_message`` is frequently upstream
+    or exception text (e.g. a FetchError echoing a server response) and the
+    page is served publicly, so unescaped interpolation would be an
+    injection vector.
+    """
+    last_run_html = (
+        f"    <p><em>Last successful run: {html.escape(str(last_successful_run))}</em></p>"
+        if last_successful_run else "")
+    return _ERROR_HTML % {'message': html.escape(str(error_message)),
+                          'last_run': last_run_html}
+
+
+def generate_empty_html(message="No upcoming events found"):
+    """Generate HTML page for empty state.
 
-    Reads through the caller-supplied (read-only) connection instead of opening
-    one per event, so rendering N past-event cards doesn't open N connections.
+    ``message`` is HTML-escaped for the same reason as the error page: it is
+    rendered on a public page and could originate from upstream text.
     """
-    try:
-        entries = db.get_entries_for_event(conn, event_id)
+    return _EMPTY_HTML % {'message': html.escape(str(message))}
 
-        if not entries:
-            return None
 
-        hours = []
-        sold = []
-        for entry in entries:
-            try:
-                tickets_time = dateutil.parser.parse(entry[3])
-                # Make both naive for comparison
-                if tickets_time.tzinfo is not None:
-                    tickets_time = tickets_time.replace(tzinfo=None)
-                event_time_naive = event_time.replace(tzinfo=None) if event_time.tzinfo else event_time
+def _staging_path(out_path):
+    """Return the temporary file a page is written to before it replaces ``out_path``."""
+    return out_path.with_name(out_path.name + '.tmp')
 
-                h_diff = (event_time_naive - tickets_time).total_seconds() / 3600
 
-                hours.append(h_diff)
-                sold.append(entry[1])
-            except (dateutil.parser.ParserError, ValueError, KeyError):
-                continue
+def _write_page(out_path, html_content):
+    """Write ``html_content`` to ``out_path`` atomically.
+
+    The page is written next to the target and renamed over it, so the web
+    server serving ``out_path`` sees either the old page or the new one,
+    never a half-written file.
+    """
+    tmp_path = _staging_path(out_path)
+    tmp_path.write_text(html_content, encoding='utf-8')
+    os.replace(tmp_path, out_path)
+
+
+def _sold_in_windows(entries, now_epoch, windows):
+    """Return the tickets sold within each of ``windows`` (minutes) before ``now_epoch``.
 
-        if not hours or not sold:
+    ``entries`` are ``(sold, available, epoch)`` rows. A window's figure is
+    the spread between the highest and lowest count sampled inside it, or 0
+    with fewer than two samples. The samples are put in time order once, so
+    each window is the tail found by a binary search rather than a mask over
+    every sample. Max minus min (not last minus first) is kept because the
+    count can dip when tickets are returned.
+    """
+    import numpy as np
+
+    sold = np.fromiter((ent[0] for ent in entries), dtype=np.int64, count=len(entries))
+    stamps = np.fromiter((ent[2] for ent in entries), dtype=np.float64, count=len(entries))
+    # Usually already in order (rows come sorted by TIMESTAMP text), but
+    # mixed UTC offsets can reorder the epochs.
+    order = np.argsort(stamps, kind='stable')
+    sold, stamps = sold[order], stamps[order]
+    starts = np.searchsorted(stamps, now_epoch - np.asarray(windows) * 60)
+    result = []
+    for start in starts.tolist():
+        window = sold[start:]
+        result.append(int(window.max() - window.min()) if window.size >= 2 else 0)
+    return result
+
+
+# Mini graphs are drawn as inline SVG in a fixed viewBox, covering the last
+# MINI_GRAPH_HOURS before kickoff.
+MINI_GRAPH_WIDTH = 240
+MINI_GRAPH_HEIGHT = 120
+MINI_GRAPH_HOURS = 300
+
+_MINI_GRAPH_SVG = (
+    '<svg class="mini-graph" viewBox="0 0 %(w)d %(h)d" preserveAspectRatio="none" '
+    'role="img" aria-label="Sales graph" xmlns="http://www.w3.org/2000/svg">'
+    '<rect width="%(w)d" height="%(h)d" fill="none" stroke="#000" '
+    'stroke-width="0.5" vector-effect="non-scaling-stroke"/>'
+    '<polyline fill="none" stroke="#d9534f" stroke-width="1.5" '
+    'vector-effect="non-scaling-stroke" points="%(points)s"/></svg>')
+
+
+def generate_mini_graph(event_id, event_time, entries):
+    """Generate mini graph for a single event. Returns an inline SVG string or None.
+
+    ``entries`` is the event's ``(sold, available, epoch)`` rows as returned
+    by db.get_entries_for_events; generate_page loads every card's rows in
+    one query, so drawing N past-event cards doesn't cost N queries.
+
+    The graph is a single polyline, so it is written as SVG directly rather
+    than rasterised by matplotlib and embedded as a base64 PNG: no figure,
+    no zlib or base64 pass, and a smaller page. The SVG holds only numbers
+    and fixed markup, so the template can insert it unescaped.
+    """
+    import numpy as np
+    from lib import series
+
+    try:
+        if not entries:
             return None
 
-        # Filter to last 300 hours
-        filtered_hours = [h for h in hours if h <= 300]
-        filtered_sold = [s for h, s in zip(hours, sold) if h <= 300]
+        # Entry timestamps come back as UTC epoch seconds, so the series is
+        # unpacked column-wise straight into arrays with no per-row parsing.
+        # A naive kickoff is UTC, like the stored timestamps.
+        if event_time.tzinfo is None:
+            event_time = event_time.replace(tzinfo=datetime.timezone.utc)
+        sold, _, stamps = (np.asarray(col) for col in zip(*entries))
+        hours = (event_time.timestamp() - stamps) / 3600
+
+        # Filter to the window with one boolean mask over both series
+        recent = hours <= MINI_GRAPH_HOURS
+        filtered_hours, filtered_sold = series.downsample(hours[recent], sold[recent])
 
-        if not filtered_hours:
+        if not filtered_hours.size:
             return None
 
-        # Create mini graph
-        fig, ax = plt.subplots(figsize=(3, 1.5))
-        try:
-            ax.plot(filtered_hours, filtered_sold, color='#d9534f', linewidth=1.5)
-            ax.set_xlim([0, 300])
-            ax.invert_xaxis()
-            ax.set_xticks([])
-            ax.set_yticks([])
-            for spine in ax.spines.values():
-                spine.set_linewidth(0.5)
-            ax.grid(False)
-
-            tmpfile = io.BytesIO()
-            plt.savefig(tmpfile, format='png', dpi=80, bbox_inches='tight', pad_inches=0.05)
-            img = base64.b64encode(tmpfile.getvalue()).decode('utf-8')
-        finally:
-            # Release the figure on every path; previously a plotting error
-            # after subplots() left it open for the rest of the cron run.
-            plt.close(fig)
-
-        return img
+        # Kickoff is on the right edge. The sold range gets a 5% margin above
+        # and below, as matplotlib's autoscaling gave; a flat series sits
+        # mid-height.
+        xs = (MINI_GRAPH_HOURS - filtered_hours) * (MINI_GRAPH_WIDTH / MINI_GRAPH_HOURS)
+        low, high = filtered_sold.min(), filtered_sold.max()
+        span = (high - low) * 1.1 or 2
+        ys = MINI_GRAPH_HEIGHT * (1 - (filtered_sold - (low + high - span) / 2) / span)
+        points = ' '.join(f'{x:.1f},{y:.1f}' for x, y in zip(xs.tolist(), ys.tolist()))
+        return _MINI_GRAPH_SVG % {'w': MINI_GRAPH_WIDTH, 'h': MINI_GRAPH_HEIGHT,
+                                  'points': points}
     except Exception as e:
         logger.warning(f"Failed to generate mini graph for {event_id}: {e}")
         return None
 
 
+@functools.lru_cache(maxsize=None)
+def _template_env(templ_path):
+    """Return the Jinja environment for ``templ_path``, built once per process.
+
+    The compiled template is kept in Jinja's on-disk bytecode cache (a private
+    per-user temp directory), so each cron run loads it instead of parsing the
+    template again. The cache is keyed on the template source, so an edited
+    template is still picked up; ``auto_reload`` is off because the template
+    does not change during a run.
+    """
+    import jinja2
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(templ_path),
+        autoescape=jinja2.select_autoescape(['html', 'tmpl']),
+        bytecode_cache=jinja2.FileSystemBytecodeCache(),
+        auto_reload=False)
+
+
 def generate_page(db_path, out_path, template_dir='templates'):
     """Generate HTML page from database."""
+    import jinja2
+    from lib import graph
+
     # Connect to database. Read-only: generate_page only reads, and the data
     # was already written by the fetch loop in main(); a shared connection is
-    # reused for every event + mini-graph instead of one per section/card.
+    # reused for every event, mini-graph and the main graph instead of one
+    # per section/card.
     try:
         conn = db.open_connection(str(db_path), read_only=True)
     except Exception as e:
         logger.error(f"Failed to connect to database: {e}")
         html_content = generate_error_html(f"Database connection failed: {e}")
-        out_path.write_text(html_content, encoding='utf-8')
+        _write_page(out_path, html_content)
         return False
 
     try:
-        # Get events from database (only future events)
-        events_data = db.get_events(conn)
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        # Past events are shown from the current season (July onwards); if
+        # we're before July, the season started last year's July.
+        current_year = now.year
+        if now.month < 7:
+            season_start = datetime.datetime(current_year - 1, 7, 1)
+        else:
+            season_start = datetime.datetime(current_year, 7, 1)
+
+        # Get this season's and future events from the database; older ones
+        # are left out by the query. A day of slack covers kickoffs stored
+        # with a UTC offset, which the exact comparisons below account for.
+        events_data = db.get_events(
+            conn, since=(season_start - datetime.timedelta(days=1)).date())
         if not events_data:
             logger.info("No events found in database")
             html_content = generate_empty_html()
-            out_path.write_text(html_content, encoding='utf-8')
+            _write_page(out_path, html_content)
             return False
 
-        # Parse events for template with latest sold/avail data (future events only)
-        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
-        events = []
-        for entry in events_data:
-            event_id = entry[0]
+        # Parse each kickoff once; both the future and the past sections
+        # below work from this list. Normalised to UTC before stripping tz
+        # for naive comparison; otherwise a non-UTC offset in the API string
+        # (e.g. +01:00) shifts the future/past classification.
+        parsed_events = []
+        for event_id, title, when in events_data:
             try:
-                event_time = dateutil.parser.parse(entry[2])
-                # Normalise to UTC before stripping tz for naive comparison;
-                # graph.py does the same. Otherwise a non-UTC offset in the API
-                # string (e.g. +01:00) shifts the future/past classification.
-                if event_time.tzinfo is not None:
-                    event_time = event_time.astimezone(datetime.timezone.utc)
-                event_time = event_time.replace(tzinfo=None)
-            except (dateutil.parser.ParserError, ValueError) as e:
-                logger.warning(f"Error parsing date for event {entry[0]}: {e}")
-                continue
+                parsed_events.append((event_id, title, db.parse_timestamp(when)))
+            except ValueError as e:
+                logger.warning(f"Error parsing date for event {event_id}: {e}")
 
+        # Load the entries of every event shown below -- future cards and this
+        # season's past cards with their mini graphs -- in one query.
+        entries_by_event = db.get_entries_for_events(
+            conn, [event_id for event_id, _, event_time in parsed_events
+                   if event_time >= season_start])
+
+        # Parse events for template with latest sold/avail data (future events only)
+        events = []
+        for event_id, title, event_time in parsed_events:
             # Only show future events
             if event_time < now:
                 continue
 
-            # Get all entries for this event
-            entries = db.get_entries_for_event(conn, event_id)
+            entries = entries_by_event.get(event_id)
             if entries:
                 # Latest entry is the last one
                 latest = entries[-1]
-                event_data = {
-                    "title": entry[1],
-                    "id": event_id,
-                    "sold": latest[1],
-                    "avail": latest[2],
-                }
+                event_data = EventCard(title=title, id=event_id,
+                                       sold=latest[0], avail=latest[1])
 
                 # Calculate capacity percentage from the estimated total (online
                 # sales + season tickets / sponsors / VIP) against stadium capacity.
-                total_sold = (latest[1]
+                total_sold = (latest[0]
                               + EST_SEASON_TICKETS + EST_SPONSORS + EST_VIP)
                 capacity = int((total_sold / STADIUM_CAPACITY) * 100)
-                event_data["capacity_percent"] = capacity
+                event_data.capacity_percent = capacity
 
                 # Calculate sales velocity
                 if len(entries) >= 2:
-                    # Get timestamps for velocity calculation
-                    timestamps = []
-                    for ent in entries:
-                        try:
-                            ts = dateutil.parser.parse(ent[3])
-                            # Normalise to UTC before stripping tz, matching
-                            # the event_time handling above; `now` is UTC-naive,
-                            # so a naive strip of a +02:00 value would shift the
-                            # window comparisons by the offset.
-                            if ts.tzinfo is not None:
-                                ts = ts.astimezone(datetime.timezone.utc)
-                            ts = ts.replace(tzinfo=None)
-                            timestamps.append((ts, ent[1]))
-                        except Exception:
-                            continue
-
-                    if len(timestamps) >= 2:
-                        timestamps.sort()
-
-                        # Calculate velocity as difference between oldest and newest in each time window
-                        def get_sold_in_window(window_minutes):
-                            window_ago = now - datetime.timedelta(minutes=window_minutes)
-                            window_entries = [s for t, s in timestamps if t >= window_ago]
-                            if len(window_entries) >= 2:
-                                return max(window_entries) - min(window_entries)
-                            return 0
-
-                        ten_min_sold = get_sold_in_window(10)
-                        one_hour_sold = get_sold_in_window(60)
-                        one_day_sold = get_sold_in_window(1440)
-
-                        velocity_parts = []
-                        if one_day_sold > 0:
-                            velocity_parts.append(f"{one_day_sold} tickets in last day")
-                        if one_hour_sold > 0:
-                            velocity_parts.append(f"{one_hour_sold} in last hour")
-                        if ten_min_sold > 0:
-                            velocity_parts.append(f"{ten_min_sold} in last 10min")
-
-                        if velocity_parts:
-                            event_data["velocity"] = " | ".join(velocity_parts)
+                    now_epoch = now.replace(tzinfo=datetime.timezone.utc).timestamp()
+                    one_day_sold, one_hour_sold, ten_min_sold = _sold_in_windows(
+                        entries, now_epoch, (1440, 60, 10))
+
+                    velocity_parts = []
+                    if one_day_sold > 0:
+                        velocity_parts.append(f"{one_day_sold} tickets in last day")
+                    if one_hour_sold > 0:
+                        velocity_parts.append(f"{one_hour_sold} in last hour")
+                    if ten_min_sold > 0:
+                        velocity_parts.append(f"{ten_min_sold} in last 10min")
+
+                    if velocity_parts:
+                        event_data.velocity = " | ".join(velocity_parts)
 
                 events.append(event_data)
 
         if not events:
             logger.info("No future events to display")
             html_content = generate_empty_html()
-            out_path.write_text(html_content, encoding='utf-8')
+            _write_page(out_path, html_content)
             return False
 
-        # Fetch past events (from current season - July onwards). Reuse the same
-        # read-only connection and the event list already fetched above; nothing
-        # was written so it is still current.
-        # Get current year, if we're before July, use last year's July
-        current_year = now.year
-        if now.month < 7:
-            season_start = datetime.datetime(current_year - 1, 7, 1)
-        else:
-            season_start = datetime.datetime(current_year, 7, 1)
-
+        # Past events from the current season, from the entries loaded above.
         past_events = []
-        for entry in events_data:
-            event_id = entry[0]
-            try:
-                event_time = dateutil.parser.parse(entry[2])
-                if event_time.tzinfo is not None:
-                    event_time = event_time.astimezone(datetime.timezone.utc)
-                event_time = event_time.replace(tzinfo=None)
-            except (dateutil.parser.ParserError, ValueError):
-                continue
-
+        for event_id, title, event_time in parsed_events:
             # Only past events from current season
             if event_time >= now or event_time < season_start:
                 continue
 
-            # Get latest entry for this event
-            entries = db.get_entries_for_event(conn, event_id)
+            entries = entries_by_event.get(event_id)
             if entries:
                 latest = entries[-1]
                 # Extract away team name (remove "GAK 1902 : " prefix)
-                title = entry[1]
-                if " : " in title:
-                    title = title.split(" : ", 1)[1]
+                _, sep, opponent = title.partition(" : ")
+                if sep:
+                    title = opponent
                 # Generate mini graph for this event
-                mini_graph = generate_mini_graph(event_id, event_time, conn)
-                past_events.append({
-                    "title": title,
-                    "date": event_time.strftime('%Y-%m-%d'),
-                    "sold": latest[1],
-                    "graph": mini_graph,
-                    "event_id": event_id,
-                })
+                mini_graph = generate_mini_graph(event_id, event_time, entries)
+                past_events.append(PastEventCard(
+                    title=title,
+                    date=event_time.strftime('%Y-%m-%d'),
+                    sold=latest[0],
+                    graph=mini_graph,
+                    event_id=event_id,
+                ))
 
         # Sort by sold descending for ranking
-        past_events.sort(key=lambda x: x['sold'], reverse=True)
+        past_events.sort(key=lambda x: x.sold, reverse=True)
 
         # Add rankings and mark top 3
         for i, event in enumerate(past_events):
-            event['rank'] = i + 1
+            event.rank = i + 1
             if i < 3:
-                event['top_performer'] = True
+                event.top_performer = True
 
         # Re-sort by date for display
-        past_events.sort(key=lambda x: x['date'], reverse=True)
+        past_events.sort(key=lambda x: x.date, reverse=True)
 
         # Create season summary
         if past_events:
-            total_sold = sum(e['sold'] for e in past_events)
+            total_sold = sum(e.sold for e in past_events)
             avg_sold = total_sold // len(past_events)
             season_summary = f"{len(past_events)} matches this season, average {avg_sold} tickets sold"
         else:
             season_summary = None
 
+        # Generate graph through the same connection (and warm page cache)
+        # instead of reopening the database.
+        try:
+            img = graph.generate_graph(conn)
+            if img is None:
+                logger.error("Failed to generate graph, using fallback page")
+                html_content = generate_error_html("Failed to generate sales graph")
+                _write_page(out_path, html_content)
+                return False
+        except Exception as e:
+            logger.error(f"Critical error in graph generation: {e}")
+            logger.debug(traceback.format_exc())
+            html_content = generate_error_html(f"Critical error: {e}")
+            _write_page(out_path, html_content)
+            return False
+
     finally:
         conn.close()
 
-    # Generate graph
-    try:
-        img = graph.generate_graph(str(db_path))
-        if img is None:
-            logger.error("Failed to generate graph, using fallback page")
-            html_content = generate_error_html("Failed to generate sales graph")
-            out_path.write_text(html_content, encoding='utf-8')
-            return False
-    except Exception as e:
-        logger.error(f"Critical error in graph generation: {e}")
-        logger.debug(traceback.format_exc())
-        html_content = generate_error_html(f"Critical error: {e}")
-        out_path.write_text(html_content, encoding='utf-8')
-        return False
-
     # Render HTML
     try:
         # Anchor a relative template dir on this script's location, not the
@@ -406,35 +465,34 @@ def generate_page(db_path, out_path, template_dir='templates'):
         templ_path = Path(template_dir)
         if not templ_path.is_absolute():
             templ_path = Path(__file__).resolve().parent / templ_path
-        jenv = jinja2.Environment(
-            loader=jinja2.FileSystemLoader(str(templ_path)),
-            autoescape=jinja2.select_autoescape(['html', 'tmpl']))
-        ticket_tmpl = jenv.get_template("ticket-html.tmpl")
+        ticket_tmpl = _template_env(str(templ_path)).get_template("ticket-html.tmpl")
 
         # Last updated timestamp
         last_updated = now.strftime('%Y-%m-%d %H:%M:%S')
 
-        html_content = ticket_tmpl.render(
+        # Stream the render straight into the staging file rather than
+        # building the whole page as one string first.
+        tmp_path = _staging_path(out_path)
+        ticket_tmpl.stream(
             events=events, img=img, past_events=past_events,
             season_summary=season_summary, last_updated=last_updated,
             EST_SEASON_TICKETS=EST_SEASON_TICKETS, EST_SPONSORS=EST_SPONSORS,
-            EST_VIP=EST_VIP, EST_EXTRA=EST_EXTRA, EST_DEDUCT=EST_DEDUCT)
-
-        # Write to output file
-        out_path.write_text(html_content, encoding='utf-8')
+            EST_VIP=EST_VIP, EST_EXTRA=EST_EXTRA, EST_DEDUCT=EST_DEDUCT,
+        ).dump(str(tmp_path), encoding='utf-8')
+        os.replace(tmp_path, out_path)
         logger.info(f"Successfully generated ticket report: {out_path}")
         return True
 
     except jinja2.TemplateError as e:
         logger.error(f"Template rendering error: {e}")
         html_content = generate_error_html(f"Template error: {e}")
-        out_path.write_text(html_content, encoding='utf-8')
+        _write_page(out_path, html_content)
         return False
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         logger.debug(traceback.format_exc())
         html_content = generate_error_html(f"Unexpected error: {e}")
-        out_path.write_text(html_content, encoding='utf-8')
+        _write_page(out_path, html_content)
         return False
 
 
@@ -566,6 +624,34 @@ def _log_to_file_only(level, msg):
             handler.handle(record)
 
 
+def _reuse_closed_sales(conn, events):
+    """Split ``events`` into ready rows and events that still need a fetch.
+
+    Returns ``(rows, to_fetch)``. An event whose online sale window has ended
+    and that already has a sample becomes an ``(event, parsed)`` row built
+    from that sample; every other event (still on sale, unparseable or
+    non-string window, or never sampled) is left to fetch.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    rows, to_fetch = [], []
+    for event in events:
+        try:
+            closed = db.parse_timestamp(event.get("publiclyAvailableTo") or "") < now
+        except (TypeError, ValueError):  # e.g. an epoch number, not a string
+            closed = False
+        latest = db.get_latest_entry(conn, event["id"]) if closed else None
+        if latest is None:
+            to_fetch.append(event)
+            continue
+        rows.append((event, {
+            "title": event.get("title", "Unknown"),
+            "id": event["id"],
+            "sold": latest[0],
+            "avail": latest[1],
+        }))
+    return rows, to_fetch
+
+
 def main():
     parser = argparse.ArgumentParser(description='Fetch GAK ticket data from API and optionally generate HTML')
     parser.add_argument('--db', default='data/ticket.db',
@@ -576,6 +662,9 @@ def main():
                         help='Template directory path (default: templates)')
     parser.add_argument('--timeout', type=int, default=api.REQUEST_TIMEOUT,
                         help='Request timeout in seconds (default: 30)')
+    parser.add_argument('--workers', type=int, default=api.MAX_WORKERS,
+                        help='Concurrent event-detail requests '
+                             f'(default: {api.MAX_WORKERS})')
     parser.add_argument('--log', default=None,
                         help='Log file path (default: /var/log/gak-ticket.log, or stdout only if not writable)')
     parser.add_argument('--log-level', default=None,
@@ -594,6 +683,8 @@ def main():
                         help='Generate HTML page after fetching data')
 
     args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
 
     # Apply the resolved stdout log level to the stdout handler (created at
     # module import via basicConfig on the root logger). The file handler
@@ -646,15 +737,22 @@ def main():
         logger.error(f"Failed to initialize database: {e}")
         if args.generate:
             html_content = generate_error_html(f"Database initialization failed: {e}")
-            out_path.write_text(html_content, encoding='utf-8')
+            _write_page(out_path, html_content)
         sys.exit(1)
 
     # Fetch events
     base_url = "https://ticket.grazerak.at/backend/events/"
     events_ep = "futurePublishedEvents"
+    # One keep-alive session for every request of this run (same host), so
+    # the TLS handshake is paid once rather than per event.
+    session = api.make_session(args.workers)
+    # Responses remembered from earlier runs: unchanged resources come back
+    # as a header-only 304 instead of a full download.
+    cache = api.ResponseCache(db.load_http_cache(conn))
 
     try:
-        events_data = api.fetch_events(base_url, events_ep, args.timeout)
+        events_data = api.fetch_events(base_url, events_ep, args.timeout,
+                                       session=session, cache=cache)
     except api.FetchError as e:
         msg = f"Failed to fetch events: {e}"
         if _within_grace(state_path, grace_seconds):
@@ -665,12 +763,12 @@ def main():
             logger.info("Upstream fetch failing; within alert-grace window, "
                         "suppressing cron email")
             if args.generate and not out_path.exists():
-                out_path.write_text(generate_error_html(msg), encoding='utf-8')
+                _write_page(out_path, generate_error_html(msg))
             sys.exit(0)
         # Grace window elapsed: sustained outage -> alert normally.
         logger.error(msg)
         if args.generate:
-            out_path.write_text(generate_error_html(msg), encoding='utf-8')
+            _write_page(out_path, generate_error_html(msg))
         sys.exit(1)
 
     # Server responded (even with an empty list): any outage is over.
@@ -680,36 +778,46 @@ def main():
         logger.info("No events found from API")
         if args.generate:
             html_content = generate_empty_html()
-            out_path.write_text(html_content, encoding='utf-8')
+            _write_page(out_path, html_content)
         sys.exit(0)
 
-    # Process events
-    events_updated = 0
+    # Process events. Details are fetched and parsed concurrently (one HTTPS
+    # round trip per event); DB writes stay on this thread.
+    events = []
     for event in events_data:
-        event_id = event.get("id")
-        if not event_id:
+        if not event.get("id"):
             logger.warning("Event missing ID, skipping")
             continue
-
-        try:
-            content = api.fetch_event_details(base_url, event_id, args.timeout)
-        except api.FetchError as e:
-            logger.error(f"{e}; skipping")
-            continue
-
-        parsed = api.parse_event_data(event, content)
-        if parsed:
-            if db.update_event(conn, event, parsed):
-                events_updated += 1
+        events.append(event)
+
+    # Once online sales have closed (publiclyAvailableTo has passed) the
+    # counts can no longer change, so such events reuse their last sample
+    # instead of downloading the stadium config again.
+    rows, to_fetch = _reuse_closed_sales(conn, events)
+
+    results = api.fetch_all_event_data(base_url, to_fetch, args.timeout,
+                                       max_workers=args.workers,
+                                       session=session, cache=cache)
+    session.close()
+
+    for event, parsed in zip(to_fetch, results):
+        if isinstance(parsed, api.FetchError):
+            logger.error(f"{parsed}; skipping")
+        elif parsed:
+            rows.append((event, parsed))
         else:
-            logger.error(f"Failed to parse event {event_id}, skipping")
+            logger.error(f"Failed to parse event {event['id']}, skipping")
 
-    conn.commit()
+    # One transaction for the whole run instead of two statements per event.
+    events_updated = db.update_events(conn, rows)
+    db.save_http_cache(conn, cache.updated, cache.seen)
     # Bound ENTRIES growth: trim samples older than the retention window.
     # Safe after the commit; a failure here is logged, not fatal.
     pruned = db.prune_old_entries(conn)
     if pruned:
         logger.info(f"Pruned {pruned} old entr{'y' if pruned == 1 else 'ies'}")
+    # Keep the planner's view of ENTRIES current as it grows and is pruned.
+    db.refresh_stats(conn)
     conn.close()
 
     logger.info(f"Updated {events_updated} event(s)")